@@ -0,0 +1,73 @@
+import json
+import os
+import stat
+
+import yaml
+
+
+UPGRADE_STRATEGY = '''#!/usr/bin/env python3
+import json
+import sys
+
+from catalog_update.upgrade_strategy import semantic_versioning
+
+
+tags = json.loads(sys.stdin.read())
+print(json.dumps({'tags': {k: semantic_versioning(v) for k, v in tags.items() if semantic_versioning(v)}}))
+'''
+STRATEGIES = ('executable', 'builtin', 'mixed')
+
+
+def generate_item(item_path: str, registry: str, repository: str, strategy: str, values_padding: int) -> None:
+    os.makedirs(item_path)
+    with open(os.path.join(item_path, 'item.yaml'), 'w') as f:
+        f.write(yaml.safe_dump({'categories': ['benchmark'], 'icon_url': 'https://example.com/icon.png'}))
+    with open(os.path.join(item_path, 'Chart.yaml'), 'w') as f:
+        f.write(yaml.safe_dump({
+            'apiVersion': 'v2', 'name': os.path.basename(item_path), 'version': '1.0.0', 'appVersion': '1.0.0',
+        }, sort_keys=False))
+
+    values = {
+        'image': {'repository': f'{registry}/{repository}', 'tag': '0.1.0', 'pullPolicy': 'IfNotPresent'},
+        'postgresImage': {'repository': f'{registry}/library/postgres', 'tag': '0.1.0'},
+        # Unrelated configuration so that values files have a realistic size for yaml parsing
+        'config': {f'option{i}': {'enabled': True, 'value': f'value-{i}'} for i in range(values_padding)},
+    }
+    for filename in ('ix_values.yaml', 'test_values.yaml'):
+        with open(os.path.join(item_path, filename), 'w') as f:
+            f.write(yaml.safe_dump(values, sort_keys=False))
+
+    upgrade_info = {
+        'filename': 'ix_values.yaml',
+        'keys': ['image', 'postgresImage'],
+        'test_filename': 'test_values.yaml',
+    }
+    if strategy == 'builtin':
+        upgrade_info['strategies'] = {k: {'type': 'semver'} for k in upgrade_info['keys']}
+        upgrade_info['app_version_key'] = 'image'
+    else:
+        strategy_path = os.path.join(item_path, 'upgrade_strategy')
+        with open(strategy_path, 'w') as f:
+            f.write(UPGRADE_STRATEGY)
+        os.chmod(strategy_path, os.stat(strategy_path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    with open(os.path.join(item_path, 'upgrade_info.json'), 'w') as f:
+        f.write(json.dumps(upgrade_info, indent=4))
+
+
+def generate_catalog(
+    path: str, trains: int, items: int, registry: str, repositories: int = 50, strategy: str = 'mixed',
+    values_padding: int = 50,
+) -> list:
+    # Generates `trains` x `items` catalog item(s) in the layout catalog_update expects, item(s) reference
+    # `repositories` distinct repositories so that lookups of popular images are shared between item(s)
+    item_paths = []
+    for train_index in range(trains):
+        for item_index in range(items):
+            item_path = os.path.join(path, f'train{train_index}', f'item{item_index}')
+            item_strategy = strategy if strategy != 'mixed' else STRATEGIES[item_index % 2]
+            repository = f'benchmark/image{(train_index * items + item_index) % repositories}'
+            generate_item(item_path, registry, repository, item_strategy, values_padding)
+            item_paths.append(item_path)
+
+    return item_paths
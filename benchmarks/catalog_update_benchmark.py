@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog_generator import STRATEGIES, generate_catalog  # noqa: E402
+from fake_registry import FakeRegistry  # noqa: E402
+
+from catalog_update.docker_utils import setup_tags_backend  # noqa: E402
+from catalog_update.profiling import setup_profiler  # noqa: E402
+from catalog_update.registry import setup_registry_client  # noqa: E402
+from catalog_update.scripts.catalog_update import apply_plan_file, plan_trains, update_catalogs  # noqa: E402
+from catalog_update.tag_cache import setup_tag_cache  # noqa: E402
+from catalog_update.validation_cache import item_content_hash, setup_validation_cache  # noqa: E402
+
+
+def setup_lookups(registry: FakeRegistry, item_paths: list) -> None:
+    setup_tags_backend('registry')
+    setup_registry_client(insecure_registries=[registry.host])
+    setup_tag_cache()
+    # Synthetic item(s) are not complete charts and would fail catalog validation, so they are marked as validated
+    # and validation is only accounted for by checking their content hash
+    validation_cache = setup_validation_cache()
+    for item_path in item_paths:
+        validation_cache.add(item_content_hash(item_path))
+
+
+def git(repo_path: str, *args) -> str:
+    return subprocess.run(
+        ['git', '-c', 'user.name=benchmark', '-c', 'user.email=benchmark@localhost', *args], cwd=repo_path,
+        check=True, capture_output=True, text=True,
+    ).stdout
+
+
+def generate_repo(repo_path: str, registry: FakeRegistry, args: argparse.Namespace) -> tuple:
+    # Catalog is generated in a git repository with an origin, as the CLI checks out its branches before updating it
+    catalog_path = os.path.join(repo_path, 'library', 'ix-dev')
+    item_paths = generate_catalog(
+        catalog_path, args.trains, args.items, registry.host, args.repositories, args.strategy, args.values_padding,
+    )
+    os.makedirs(f'{repo_path}.git')
+    git(f'{repo_path}.git', 'init', '-q', '--bare')
+    git(repo_path, 'init', '-q', '-b', 'master')
+    git(repo_path, 'add', '-A')
+    git(repo_path, 'commit', '-q', '-m', 'Synthetic catalog')
+    git(repo_path, 'remote', 'add', 'origin', f'{repo_path}.git')
+    git(repo_path, 'push', '-q', 'origin', 'master')
+    return catalog_path, item_paths
+
+
+def upgraded_items(repo_path: str) -> int:
+    return sum(1 for line in git(repo_path, 'status', '--porcelain').splitlines() if line.endswith('/Chart.yaml'))
+
+
+def measure(results: list, phase: str, items: int, registry: FakeRegistry, func, *args) -> None:
+    # Every phase runs through the same entry points as the CLI with a fresh profiler, so that its duration can be
+    # broken down into the time spent validating, looking up tags, running strategies and loading / patching yaml
+    requests = registry.requests.copy()
+    profiler = setup_profiler()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func(*args)
+    duration = time.perf_counter() - start
+    results.append({
+        'phase': phase,
+        'duration': duration,
+        'items': items,
+        'items_per_second': items / duration if duration else None,
+        'registry_requests': sum((registry.requests - requests).values()),
+        'spans': profiler.aggregate(),
+    })
+
+
+def benchmark(args: argparse.Namespace) -> list:
+    results = []
+    work_dir = tempfile.mkdtemp(prefix='catalog_update_benchmark_')
+    registry = FakeRegistry(args.tags, args.latency, args.page_size).start()
+    # Executable upgrade strategies of synthetic item(s) import catalog_update
+    os.environ['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [os.path.dirname(os.path.dirname(os.path.abspath(__file__))), os.environ.get('PYTHONPATH')])
+    )
+    try:
+        repo_path = os.path.join(work_dir, 'plan')
+        catalog_path, item_paths = generate_repo(repo_path, registry, args)
+        count = len(item_paths)
+        plan_path = os.path.join(work_dir, 'plan.json')
+
+        setup_lookups(registry, item_paths)
+        measure(results, 'plan (cold tags)', count, registry, plan_trains, catalog_path, plan_path, args.jobs)
+        measure(results, 'plan (warm tags)', count, registry, plan_trains, catalog_path, plan_path, args.jobs)
+        measure(results, 'apply', count, registry, apply_plan_file, catalog_path, [plan_path], False)
+
+        repo_path = os.path.join(work_dir, 'update')
+        catalog_path, item_paths = generate_repo(repo_path, registry, args)
+        setup_lookups(registry, item_paths)
+        measure(results, 'update (end-to-end)', count, registry, update_catalogs, [catalog_path], False, args.jobs)
+        upgraded = upgraded_items(repo_path)
+        if upgraded != count:
+            print(f'WARNING: only {upgraded} of {count} item(s) were upgraded', file=sys.stderr)
+    finally:
+        setup_registry_client()
+        registry.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Benchmark catalog_update against a synthetic catalog and a local fake registry'
+    )
+    parser.add_argument('--trains', type=int, default=2, help='Number of trains in the synthetic catalog')
+    parser.add_argument('--items', type=int, default=50, help='Number of item(s) in each train')
+    parser.add_argument('--repositories', type=int, default=20, help='Number of distinct image repositories')
+    parser.add_argument('--tags', type=int, default=500, help='Number of tags of every repository')
+    parser.add_argument('--page-size', type=int, default=100, help='Number of tags per page served by the registry')
+    parser.add_argument('--latency', type=float, default=0.05, help='Latency of every registry request in seconds')
+    parser.add_argument('--strategy', choices=STRATEGIES, default='mixed', help='Upgrade strategy of item(s)')
+    parser.add_argument('--values-padding', type=int, default=50, help='Number of unrelated options in values files')
+    parser.add_argument('--jobs', '-j', type=int, default=8, help='Number of item(s) processed concurrently')
+    parser.add_argument('--json', help='Write results to this file as json to compare them across runs')
+    args = parser.parse_args()
+
+    results = benchmark(args)
+    print(f'{"phase":<24}{"duration (s)":>14}{"items/s":>12}{"registry requests":>20}')
+    for result in results:
+        print(
+            f'{result["phase"]:<24}{result["duration"]:>14.3f}{result["items_per_second"] or 0:>12.1f}'
+            f'{result["registry_requests"]:>20}'
+        )
+
+    # Spans of concurrently processed item(s) overlap, so their totals can add up to more than the phase duration
+    for result in results:
+        print(f'\n{result["phase"]:<24}{"count":>10}{"total (s)":>12}{"mean (s)":>12}{"max (s)":>12}')
+        for span in result['spans']:
+            print(
+                f'  {span["name"]:<24}{span["count"]:>8}{span["total"]:>12.3f}{span["total"] / span["count"]:>12.4f}'
+                f'{span["max"]:>12.3f}'
+            )
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(json.dumps({'parameters': vars(args), 'results': results}, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import asyncio
+import collections
+import itertools
+import threading
+
+from aiohttp import web
+
+
+class FakeGitHub:
+    # Stand-in for the GitHub REST API endpoints used to open pull requests: listing open PRs of a branch, creating
+    # a PR and requesting its reviewers. It can be told to answer the first `secondary_limits` PR creations with a
+    # secondary rate limit and to lose the response of the first `lost_responses` PR creations (the PR is created
+    # but a 502 is returned), so that retries and recovering the PR from the 422 of the next attempt are exercised.
+
+    def __init__(
+        self, token: str = 'benchmark', latency: float = 0.01, secondary_limits: int = 0, retry_after: int = 0,
+        lost_responses: int = 0, port: int = 0,
+    ):
+        self.token = token
+        self.latency = latency
+        self.secondary_limits = secondary_limits
+        self.retry_after = retry_after
+        self.lost_responses = lost_responses
+        self.port = port
+        self.pulls = collections.defaultdict(dict)
+        self.reviewers = {}
+        self.numbers = itertools.count(1)
+        self.requests = collections.Counter()
+        self.loop = None
+        self.runner = None
+        self.thread = None
+
+    @property
+    def api_url(self) -> str:
+        return f'http://127.0.0.1:{self.port}'
+
+    def authorized(self, request: web.Request) -> bool:
+        return request.headers.get('Authorization') == f'Bearer {self.token}'
+
+    async def list_pulls(self, request: web.Request) -> web.Response:
+        self.requests['list'] += 1
+        await asyncio.sleep(self.latency)
+        if not self.authorized(request):
+            return web.json_response({'message': 'Bad credentials'}, status=401)
+
+        repo = f'{request.match_info["owner"]}/{request.match_info["repo"]}'
+        head = request.query.get('head', '')
+        return web.json_response([
+            pull for pull in self.pulls[repo].values() if f'{request.match_info["owner"]}:{pull["head"]}' == head
+        ])
+
+    async def create_pull(self, request: web.Request) -> web.Response:
+        self.requests['create'] += 1
+        await asyncio.sleep(self.latency)
+        if not self.authorized(request):
+            return web.json_response({'message': 'Bad credentials'}, status=401)
+
+        if self.secondary_limits:
+            self.secondary_limits -= 1
+            return web.json_response(
+                {'message': 'You have exceeded a secondary rate limit. Please wait a few minutes and try again.'},
+                status=403, headers={'Retry-After': str(self.retry_after)},
+            )
+
+        repo = f'{request.match_info["owner"]}/{request.match_info["repo"]}'
+        body = await request.json()
+        if body['head'] in self.pulls[repo]:
+            return web.json_response({
+                'message': 'Validation Failed',
+                'errors': [{'message': f'A pull request already exists for {repo}:{body["head"]}.'}],
+            }, status=422)
+
+        number = next(self.numbers)
+        pull = self.pulls[repo][body['head']] = {
+            'number': number,
+            'title': body['title'],
+            'body': body['body'],
+            'head': body['head'],
+            'base': body['base'],
+            'html_url': f'https://github.com/{repo}/pull/{number}',
+        }
+        if self.lost_responses:
+            self.lost_responses -= 1
+            return web.json_response({'message': 'Server Error'}, status=502)
+        return web.json_response(pull, status=201)
+
+    async def request_reviewers(self, request: web.Request) -> web.Response:
+        self.requests['reviewers'] += 1
+        await asyncio.sleep(self.latency)
+        if not self.authorized(request):
+            return web.json_response({'message': 'Bad credentials'}, status=401)
+
+        repo = f'{request.match_info["owner"]}/{request.match_info["repo"]}'
+        number = int(request.match_info['number'])
+        pull = next((p for p in self.pulls[repo].values() if p['number'] == number), None)
+        if pull is None:
+            return web.json_response({'message': 'Not Found'}, status=404)
+
+        self.reviewers[(repo, number)] = (await request.json())['reviewers']
+        return web.json_response(pull, status=201)
+
+    def start(self) -> 'FakeGitHub':
+        app = web.Application()
+        app.router.add_get('/repos/{owner}/{repo}/pulls', self.list_pulls)
+        app.router.add_post('/repos/{owner}/{repo}/pulls', self.create_pull)
+        app.router.add_post('/repos/{owner}/{repo}/pulls/{number}/requested_reviewers', self.request_reviewers)
+        self.loop = asyncio.new_event_loop()
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, '127.0.0.1', self.port)
+        self.loop.run_until_complete(site.start())
+        self.port = self.runner.addresses[0][1]
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
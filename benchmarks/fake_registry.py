@@ -0,0 +1,74 @@
+import asyncio
+import collections
+import threading
+
+from aiohttp import web
+
+
+def generate_tags(count: int) -> list:
+    # Mix of semantic versions and tags upgrade strategies usually have to ignore
+    tags = ['latest', 'stable', 'edge']
+    tags.extend(f'{i // 100}.{i % 100}.0' for i in range(count - len(tags)))
+    return sorted(tags[:count])
+
+
+class FakeRegistry:
+    # Stand-in for a Docker Registry HTTP API v2 which serves the tags list endpoint with anonymous bearer token
+    # authentication, Link header pagination and a configurable latency for every request.
+
+    def __init__(self, tags_count: int = 200, latency: float = 0.05, page_size: int = 100, port: int = 0):
+        self.tags = generate_tags(tags_count)
+        self.latency = latency
+        self.page_size = page_size
+        self.port = port
+        self.requests = collections.Counter()
+        self.loop = None
+        self.runner = None
+        self.thread = None
+
+    @property
+    def host(self) -> str:
+        return f'127.0.0.1:{self.port}'
+
+    async def token(self, request: web.Request) -> web.Response:
+        self.requests['token'] += 1
+        await asyncio.sleep(self.latency)
+        return web.json_response({'token': 'benchmark', 'expires_in': 300})
+
+    async def tags_list(self, request: web.Request) -> web.Response:
+        self.requests['tags'] += 1
+        await asyncio.sleep(self.latency)
+        name = request.match_info['name']
+        if request.headers.get('Authorization') != 'Bearer benchmark':
+            return web.Response(status=401, headers={
+                'WWW-Authenticate': f'Bearer realm="http://{self.host}/token",service="benchmark",'
+                                    f'scope="repository:{name}:pull"'
+            })
+
+        page_size = int(request.query.get('n', self.page_size))
+        last = request.query.get('last')
+        remaining = [t for t in self.tags if last is None or t > last]
+        page, headers = remaining[:page_size], {}
+        if len(remaining) > page_size:
+            headers['Link'] = f'</v2/{name}/tags/list?n={page_size}&last={page[-1]}>; rel="next"'
+        return web.json_response({'name': name, 'tags': page}, headers=headers)
+
+    def start(self) -> 'FakeRegistry':
+        app = web.Application()
+        app.router.add_get('/token', self.token)
+        app.router.add_get('/v2/{name:.+}/tags/list', self.tags_list)
+        self.loop = asyncio.new_event_loop()
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, '127.0.0.1', self.port)
+        self.loop.run_until_complete(site.start())
+        self.port = self.runner.addresses[0][1]
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+import argparse
+import json
+import os
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_github import FakeGitHub  # noqa: E402
+
+from catalog_update.github import GitHubClient  # noqa: E402
+
+
+REPO = 'truenas/charts'
+
+
+def open_pull_requests(client: GitHubClient, pulls: int, reviewers: list, jobs: int) -> list:
+    def open_pull_request(index: int) -> dict:
+        return client.create_pull_request(
+            REPO, 'master', f'catalog-update-{index}', f'Upgrade app{index}', f'Upgrade of app{index}', reviewers,
+        )
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(open_pull_request, range(pulls)))
+
+
+def verify(github: FakeGitHub, client: GitHubClient, results: list, pulls: int, reviewers: list) -> list:
+    # Every branch has exactly one PR which was returned to its caller and has the reviewers requested
+    errors = []
+    created = github.pulls[REPO]
+    if len(created) != pulls:
+        errors.append(f'{len(created)} PR(s) were created instead of {pulls}')
+    for index, result in enumerate(results):
+        branch = f'catalog-update-{index}'
+        if created.get(branch, {}).get('number') != result['number']:
+            errors.append(f'PR returned for {branch!r} is not the one which was created')
+        if reviewers and github.reviewers.get((REPO, result['number'])) != reviewers:
+            errors.append(f'Reviewers were not requested for {branch!r}')
+        if not client.pull_request_exists(REPO, branch):
+            errors.append(f'PR of {branch!r} was not found')
+    return errors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Open pull requests with the GitHub client against a local stand-in of the GitHub API'
+    )
+    parser.add_argument('--pulls', type=int, default=20, help='Number of pull requests to open')
+    parser.add_argument('--jobs', type=int, default=4, help='Number of pull requests opened concurrently')
+    parser.add_argument('--reviewers', nargs='*', default=['reviewer'], help='Reviewers requested on every PR')
+    parser.add_argument('--latency', type=float, default=0.01, help='Seconds the stand-in takes to answer a request')
+    parser.add_argument(
+        '--secondary-limits', type=int, default=1, help='Number of PR creations answered with a secondary rate limit'
+    )
+    parser.add_argument(
+        '--retry-after', type=int, default=0, help='Seconds the stand-in asks to wait after a secondary rate limit'
+    )
+    parser.add_argument(
+        '--lost-responses', type=int, default=1,
+        help='Number of PR creations whose response is lost, the PR is then recovered from the 422 of the retry'
+    )
+    parser.add_argument('--json', help='Write results to this file as json to compare them across runs')
+    args = parser.parse_args()
+
+    github = FakeGitHub(
+        latency=args.latency, secondary_limits=args.secondary_limits, retry_after=args.retry_after,
+        lost_responses=args.lost_responses,
+    ).start()
+    client = GitHubClient(github.token, github.api_url)
+    try:
+        start = time.perf_counter()
+        results = open_pull_requests(client, args.pulls, args.reviewers, args.jobs)
+        duration = time.perf_counter() - start
+        errors = verify(github, client, results, args.pulls, args.reviewers)
+    finally:
+        client.close()
+        github.stop()
+
+    print(f'Opened {args.pulls} PR(s) in {duration:.2f}s ({args.pulls / duration:.1f} PR(s)/s)')
+    print('Requests: ' + ', '.join(f'{k}={v}' for k, v in sorted(github.requests.items())))
+    for error in errors:
+        print(f'[\033[91mFAILED\x1B[0m]\t{error}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(json.dumps({
+                'parameters': vars(args), 'duration': duration, 'requests': github.requests, 'errors': errors,
+            }, indent=4))
+
+    if errors:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from catalog_update.catalog_item import (  # noqa: E402
+    IMAGE_SCHEMA, IMAGE_VALIDATOR, UPGRADE_INFO_SCHEMA, UPGRADE_INFO_VALIDATOR, UPGRADE_STRATEGY_OUTPUT_SCHEMA,
+    UPGRADE_STRATEGY_OUTPUT_VALIDATOR,
+)
+
+
+MODULES = (
+    'catalog_update.scripts.catalog_update',
+    'catalog_update.catalog_item',
+    'catalog_update.upgrade_strategy',
+    'catalog_update.registry',
+)
+VALIDATIONS = (
+    (
+        'upgrade_info', UPGRADE_INFO_SCHEMA, UPGRADE_INFO_VALIDATOR, {
+            'filename': 'values.yaml',
+            'keys': ['image', 'postgres.image'],
+            'strategies': {'image': {'type': 'semver'}, 'postgres.image': {'type': 'semver', 'prefix': 'v'}},
+        },
+    ),
+    ('image', IMAGE_SCHEMA, IMAGE_VALIDATOR, {'repository': 'ghcr.io/org/app', 'tag': '1.0.0'}),
+    (
+        'upgrade_strategy_output', UPGRADE_STRATEGY_OUTPUT_SCHEMA, UPGRADE_STRATEGY_OUTPUT_VALIDATOR,
+        {'tags': {'image': '1.2.0', 'postgres.image': '15.1'}, 'app_version': '1.2.0'},
+    ),
+)
+
+
+def import_time(module: str, runs: int) -> dict:
+    # Every import is measured in a fresh interpreter, -X importtime reports the cumulative time of the module
+    # (including everything it imports) on its last line
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')]))}
+    cumulative, wall = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        cp = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'], env=env, capture_output=True, text=True,
+        )
+        wall.append(time.perf_counter() - start)
+        if cp.returncode:
+            raise RuntimeError(f'Failed to import {module}: {cp.stderr.strip().splitlines()[-1]}')
+        cumulative.append(int(cp.stderr.strip().splitlines()[-1].split('|')[1]) / 1e6)
+
+    return {
+        'phase': f'import {module}',
+        'import': statistics.median(cumulative),
+        'interpreter': statistics.median(wall),
+    }
+
+
+def validation_overhead(name: str, schema: dict, validator, instance: dict, iterations: int) -> dict:
+    from jsonschema import validate
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        validate(instance, schema)
+    per_call = (time.perf_counter() - start) / iterations
+
+    validator.validate(instance)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        validator.validate(instance)
+    compiled_per_call = (time.perf_counter() - start) / iterations
+
+    return {
+        'phase': f'validate {name}',
+        'jsonschema_validate_us': per_call * 1e6,
+        'compiled_validator_us': compiled_per_call * 1e6,
+        'speedup': per_call / compiled_per_call,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark import time of catalog_update and schema validation')
+    parser.add_argument('--runs', type=int, default=5, help='Number of interpreters started to time every import')
+    parser.add_argument('--iterations', type=int, default=2000, help='Number of validations of every schema')
+    parser.add_argument('--json', help='Write results to this file as json to compare them across runs')
+    args = parser.parse_args()
+
+    imports = [import_time(module, args.runs) for module in MODULES]
+    print(f'{"module":<48}{"import (s)":>12}{"interpreter (s)":>18}')
+    for result in imports:
+        print(f'{result["phase"]:<48}{result["import"]:>12.3f}{result["interpreter"]:>18.3f}')
+
+    validations = [validation_overhead(*validation, args.iterations) for validation in VALIDATIONS]
+    print(f'\n{"schema":<48}{"validate (us)":>14}{"compiled (us)":>14}{"speedup":>10}')
+    for result in validations:
+        print(
+            f'{result["phase"]:<48}{result["jsonschema_validate_us"]:>14.1f}{result["compiled_validator_us"]:>14.1f}'
+            f'{result["speedup"]:>10.1f}'
+        )
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(json.dumps({'parameters': vars(args), 'results': imports + validations}, indent=4))
+
+
+if __name__ == '__main__':
+    main()
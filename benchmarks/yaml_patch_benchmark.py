@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+import argparse
+import difflib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from catalog_update.utils import get  # noqa: E402
+from catalog_update.yaml_patch import patch_scalars  # noqa: E402
+
+
+def generate_values(images: int, settings: int) -> str:
+    # Values file with `images` image keys in between `settings` other keys of varying formatting which a full
+    # round-trip might reformat
+    lines = ['# Default values', '']
+    for index in range(images):
+        lines.extend([
+            f'app{index}:',
+            '  image:',
+            f'    repository: ghcr.io/org/app{index}',
+            f'    tag: {"v" if index % 3 == 0 else ""}1.{index}.0  # pinned',
+            '    pullPolicy: IfNotPresent',
+            '  settings:',
+        ])
+        for setting in range(settings):
+            lines.append(f'      key{setting}: "value {setting}"' if setting % 2 else f'      key{setting}:  {setting}')
+        lines.extend(['  list: [a, b,   c]', '  hosts:', '  - host.local', ''])
+    return '\n'.join(lines)
+
+
+def load(contents: str):
+    import ruamel.yaml
+
+    yaml = ruamel.yaml.YAML()
+    yaml.indent(mapping=2, sequence=4, offset=2)
+    return yaml, yaml.load(contents)
+
+
+def round_trip(yaml, values, contents: str, keys: list) -> str:
+    for key, tag in keys:
+        get(values, key)['tag'] = tag
+    stream = io.StringIO()
+    yaml.dump(values, stream)
+    return stream.getvalue()
+
+
+def surgical(yaml, values, contents: str, keys: list) -> str:
+    patched = patch_scalars(contents, [(get(values, key), 'tag', tag) for key, tag in keys])
+    if patched is None:
+        raise RuntimeError('Unable to locate tag(s) of the generated values file')
+    return patched
+
+
+def changed_lines(before: str, after: str) -> int:
+    return sum(
+        1 for line in difflib.unified_diff(before.splitlines(), after.splitlines(), lineterm='', n=0)
+        if line.startswith('+') and not line.startswith('+++')
+    )
+
+
+def measure(name: str, func, contents: str, keys: list, runs: int) -> dict:
+    # Items load values files while evaluating their upgrade anyway, so only applying the upgrade to the loaded
+    # document is measured here and loading is reported separately
+    loads, durations = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        yaml, values = load(contents)
+        loads.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        result = func(yaml, values, contents, keys)
+        durations.append(time.perf_counter() - start)
+
+    return {
+        'path': name,
+        'load': statistics.median(loads),
+        'duration': statistics.median(durations),
+        'changed_lines': changed_lines(contents, result),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark surgical tag patching against a full yaml round-trip')
+    parser.add_argument('--images', type=int, default=200, help='Number of image keys in the values file')
+    parser.add_argument('--settings', type=int, default=20, help='Number of other keys of every image')
+    parser.add_argument('--upgrades', type=int, default=5, help='Number of image tags which are upgraded')
+    parser.add_argument('--runs', type=int, default=5, help='Number of times every path is measured')
+    parser.add_argument('--json', help='Write results to this file as json to compare them across runs')
+    args = parser.parse_args()
+
+    contents = generate_values(args.images, args.settings)
+    keys = [(f'app{index}.image', f'2.{index}.0') for index in range(min(args.upgrades, args.images))]
+    results = [
+        measure('round-trip', round_trip, contents, keys, args.runs),
+        measure('surgical', surgical, contents, keys, args.runs),
+    ]
+
+    print(f'Values file of {len(contents.splitlines())} lines ({len(contents) / 1024:.1f} KiB), {len(keys)} upgrade(s)')
+    print(f'{"path":<16}{"load (s)":>10}{"apply (s)":>12}{"changed lines":>16}')
+    for result in results:
+        print(
+            f'{result["path"]:<16}{result["load"]:>10.4f}{result["duration"]:>12.4f}{result["changed_lines"]:>16}'
+        )
+    print(f'apply speedup: {results[0]["duration"] / results[1]["duration"]:.1f}x')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(json.dumps({'parameters': vars(args), 'results': results}, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import stat
+import threading
+
+from typing import Optional
+
+from .utils import cache_path, read_json, write_json
+
+
+INDEX_VERSION = 1
+DEFAULT_CATALOG_INDEX_DIR = cache_path('catalog_index')
+# Files whose contents are kept in item record(s), so records are refreshed when any of these change
+INDEXED_FILES = ('upgrade_info.json', 'Chart.yaml', 'upgrade_strategy')
+
+
+def default_catalog_index_path(catalog_path: str) -> str:
+    return os.path.join(
+        DEFAULT_CATALOG_INDEX_DIR, f'{hashlib.sha256(os.path.abspath(catalog_path).encode()).hexdigest()[:16]}.json'
+    )
+
+
+def scan_item(item_path: str, mtime: int) -> dict:
+    record = {
+        'mtime': mtime,
+        'files': {},
+        'versions': [],
+        'upgrade_info': None,
+        'upgrade_strategy': False,
+        'version': None,
+    }
+    with os.scandir(item_path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                if os.path.isfile(os.path.join(entry.path, 'Chart.yaml')):
+                    record['versions'].append(entry.name)
+            elif entry.is_file():
+                entry_stat = entry.stat()
+                record['files'][entry.name] = entry_stat.st_mtime_ns
+                if entry.name == 'upgrade_strategy':
+                    record['upgrade_strategy'] = bool(entry_stat.st_mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH))
+
+    record['versions'].sort()
+    if 'upgrade_info.json' in record['files']:
+        try:
+            with open(os.path.join(item_path, 'upgrade_info.json'), 'r') as f:
+                record['upgrade_info'] = json.loads(f.read())
+        except (OSError, json.JSONDecodeError):
+            # Item will read the file itself and report the issue
+            pass
+
+    if 'Chart.yaml' in record['files']:
+        from catalog_validation.ci.utils import get_app_version
+
+        try:
+            record['version'] = get_app_version(item_path)
+        except Exception:
+            pass
+
+    return record
+
+
+def record_is_stale(item_path: str, record: dict, mtime: int) -> bool:
+    # Directory mtime changes when entries are added/removed/replaced (our writes replace files), files which
+    # are changed in place are accounted for by comparing their own mtime
+    if record.get('mtime') != mtime:
+        return True
+
+    for file_name in filter(lambda f: f in record['files'], INDEXED_FILES):
+        try:
+            if os.stat(os.path.join(item_path, file_name)).st_mtime_ns != record['files'][file_name]:
+                return True
+        except FileNotFoundError:
+            return True
+
+    return False
+
+
+class CatalogIndex:
+
+    def __init__(self, catalog_path: str, path: Optional[str] = None):
+        self.catalog_path = os.path.abspath(catalog_path)
+        self.path = path
+        self.lock = threading.Lock()
+        # Persisted records are only used once the catalog has been refreshed against them, as the catalog
+        # is usually checked out/updated after the index has been set up
+        self.persisted = self.load()
+        self.trains = {}
+
+    def load(self) -> dict:
+        index = read_json(self.path, {})
+        if index.get('version') != INDEX_VERSION or index.get('catalog_path') != self.catalog_path:
+            return {}
+
+        return index.get('trains') or {}
+
+    def refresh(self) -> None:
+        # Catalog is walked once with scandir, item(s) whose directory and indexed files have not changed since
+        # the index was persisted keep their record and are not read again
+        trains = {}
+        with os.scandir(self.catalog_path) as train_entries:
+            for train_entry in filter(lambda e: e.is_dir(), train_entries):
+                old_records = self.trains.get(train_entry.name) or self.persisted.get(train_entry.name) or {}
+                records = trains[train_entry.name] = {}
+                with os.scandir(train_entry.path) as item_entries:
+                    for item_entry in filter(lambda e: e.is_dir(), item_entries):
+                        mtime = item_entry.stat().st_mtime_ns
+                        record = old_records.get(item_entry.name)
+                        if not record or record_is_stale(item_entry.path, record, mtime):
+                            record = scan_item(item_entry.path, mtime)
+                        records[item_entry.name] = record
+
+        with self.lock:
+            self.trains = trains
+            self.persisted = {}
+
+    def train_names(self) -> list:
+        return sorted(self.trains)
+
+    def item_names(self, train: str) -> list:
+        return sorted(self.trains.get(train) or {})
+
+    def record(self, item_path: str) -> Optional[dict]:
+        train_path, item = os.path.split(os.path.abspath(item_path))
+        if os.path.dirname(train_path) != self.catalog_path:
+            return None
+        return (self.trains.get(os.path.basename(train_path)) or {}).get(item)
+
+    def save(self) -> None:
+        if not self.path:
+            return
+
+        with self.lock:
+            if not self.trains:
+                return
+            write_json(self.path, {'version': INDEX_VERSION, 'catalog_path': self.catalog_path, 'trains': self.trains})
+
+
+CATALOG_INDEXES = {}
+
+
+def get_catalog_index(catalog_path: str) -> Optional[CatalogIndex]:
+    return CATALOG_INDEXES.get(os.path.abspath(catalog_path))
+
+
+def find_item_record(item_path: str) -> Optional[dict]:
+    index = get_catalog_index(os.path.dirname(os.path.dirname(os.path.abspath(item_path))))
+    return index.record(item_path) if index else None
+
+
+def setup_catalog_index(catalog_path: str, path: Optional[str] = None) -> CatalogIndex:
+    index = CATALOG_INDEXES[os.path.abspath(catalog_path)] = CatalogIndex(catalog_path, path)
+    return index
@@ -1,28 +1,135 @@
+import copy
+import functools
+import io
 import itertools
 import json
 import os
-import ruamel.yaml
+import re
 import subprocess
 import tempfile
 
-from catalog_validation.ci.validate import validate_app
-from catalog_validation.ci.utils import get_app_version
 from collections import defaultdict
-from jsonschema import validate as json_schema_validate, ValidationError as JsonValidationError
-from pkg_resources import parse_version
+from concurrent.futures import Executor
+from packaging.version import Version
 from typing import Optional
 
 from .docker_utils import get_image_tags
-from .exceptions import ValidationException
-from .utils import get, run
+from .exceptions import RegistryError, UpgradeStrategyError, ValidationException
+from .plugins import load_upgrade_strategy, upgrade_strategy_version
+from .profiling import span
+from .schema import SchemaValidationError, SchemaValidator
+from .strategy_cache import files_digest, get_strategy_cache, tags_digest
+from .tag_filter import TagFilter
+from .upgrade_strategy import STRATEGY_TYPES, evaluate_strategies
+from .utils import get, run, write_file
+from .yaml_patch import patch_scalars
+
+
+UPGRADE_INFO_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'filename': {
+            'type': 'string',
+        },
+        'keys': {
+            'type': 'array',
+        },
+        'strategy': {
+            'type': 'string',
+        },
+        'strategies': {
+            'type': 'object',
+            'additionalProperties': {
+                'type': 'object',
+                'properties': {
+                    'type': {'type': 'string', 'enum': list(STRATEGY_TYPES)},
+                    'format': {'type': 'string'},
+                    'include': {'type': 'string'},
+                    'exclude': {'type': 'string'},
+                    'prefix': {'type': 'string'},
+                    'suffix': {'type': 'string'},
+                    'allow_prerelease': {'type': 'boolean'},
+                },
+                'required': ['type'],
+                'if': {'properties': {'type': {'const': 'datetime'}}},
+                'then': {'required': ['format']},
+                'additionalProperties': False,
+            },
+        },
+        'app_version_key': {
+            'type': 'string',
+        },
+        'tag_filters': {
+            'type': 'object',
+            'additionalProperties': {
+                'type': 'object',
+                'properties': {
+                    'include': {'type': 'string'},
+                    'exclude': {'type': 'string'},
+                    'semver_only': {'type': 'boolean'},
+                    'max_recent': {'type': 'integer', 'minimum': 1},
+                },
+                'additionalProperties': False,
+                # Registries list tags in lexical order, so only versions can tell which tags are the most recent
+                'if': {'required': ['max_recent']},
+                'then': {'properties': {'semver_only': {'const': True}}, 'required': ['semver_only']},
+            },
+        },
+    },
+    'not': {'required': ['strategy', 'strategies']},
+    'required': ['filename', 'keys'],
+}
+IMAGE_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'repository': {
+            'type': 'string',
+        },
+        'tag': {
+            'type': 'string',
+        },
+    },
+    'required': ['repository', 'tag'],
+}
+UPGRADE_STRATEGY_OUTPUT_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'tags': {
+            'type': 'object',
+        },
+        'app_version': {
+            'type': ['string', 'null'],
+        },
+    },
+    'required': ['tags'],
+}
 
+# Validators are built once and shared by every item instead of checking the schema on every validation
+UPGRADE_INFO_VALIDATOR = SchemaValidator(UPGRADE_INFO_SCHEMA)
+IMAGE_VALIDATOR = SchemaValidator(IMAGE_SCHEMA)
+UPGRADE_STRATEGY_OUTPUT_VALIDATOR = SchemaValidator(UPGRADE_STRATEGY_OUTPUT_SCHEMA)
 
-class Item:
 
-    YAML = ruamel.yaml.YAML()
+class Item:
 
-    def __init__(self, path: str):
+    def __init__(self, path: str, executor: Optional[Executor] = None, record: Optional[dict] = None):
         self.path = path
+        # Catalog index record of the item if one is available, it lets us skip stat/reading files which
+        # have not changed since the catalog was last indexed
+        self.record = record
+        self.executor = executor
+        # Yaml files are parsed only once per item, contents are kept so that we only write back changes
+        self.documents = {}
+        self.contents = {}
+
+    @functools.cached_property
+    def YAML(self):
+        # Item(s) can be upgraded concurrently and ruamel YAML instances are not thread safe, so each item gets
+        # its own instance. It is only created once yaml files are loaded, as item(s) whose upgrade decision is
+        # reused from the strategy cache never parse yaml and ruamel is not even imported then.
+        import ruamel.yaml
+
+        return ruamel.yaml.YAML()
 
     @property
     def name(self) -> str:
@@ -38,6 +145,8 @@ class Item:
 
     @property
     def upgrade_strategy_defined(self) -> bool:
+        if self.record:
+            return self.record['upgrade_strategy']
         return os.path.isfile(self.upgrade_strategy_path) and os.access(self.upgrade_strategy_path, os.X_OK)
 
     @property
@@ -46,77 +155,144 @@ class Item:
 
     @property
     def upgrade_info_defined(self) -> bool:
-        return os.path.isfile(self.upgrade_info_path)
+        return self.file_exists('upgrade_info.json')
+
+    def file_exists(self, filename: str) -> bool:
+        if self.record and '/' not in filename:
+            return filename in self.record['files']
+        return os.path.isfile(os.path.join(self.path, filename))
 
     def validate(self) -> None:
+        from catalog_validation.ci.validate import validate_app
+
         validate_app(self.path, 'catalog_update')
 
     @property
     def upgrade_info_schema(self) -> dict:
-        return {
-            'type': 'object',
-            'properties': {
-                'filename': {
-                    'type': 'string',
-                },
-                'keys': {
-                    'type': 'array',
-                },
-            },
-            'required': ['filename', 'keys'],
-        }
+        return UPGRADE_INFO_SCHEMA
 
     def upgrade_info(self) -> Optional[dict]:
         if not self.upgrade_info_defined:
             return
 
-        with open(self.upgrade_info_path, 'r') as f:
-            info = json.loads(f.read())
+        if self.record and self.record['upgrade_info'] is not None:
+            info = self.record['upgrade_info']
+        else:
+            with open(self.upgrade_info_path, 'r') as f:
+                info = json.loads(f.read())
 
         # We would like to validate that upgrade info is indeed valid and if it's
         # not we will raise an appropriate exception detailing the issue
         try:
-            json_schema_validate(info, self.upgrade_info_schema)
-        except JsonValidationError as e:
+            UPGRADE_INFO_VALIDATOR.validate(info)
+        except SchemaValidationError as e:
             raise ValidationException(f'Upgrade info failed validation: {e}')
 
+        try:
+            self.tag_filters(info)
+        except re.error as e:
+            raise ValidationException(f'Upgrade info failed validation: Invalid tag filter pattern: {e}')
+
         return info
 
+    def tag_filters(self, upgrade_info: dict) -> dict:
+        return {k: TagFilter.from_spec(v) for k, v in (upgrade_info.get('tag_filters') or {}).items()}
+
     @property
     def latest_version(self) -> str:
+        if self.record and self.record['version']:
+            return self.record['version']
+
+        from catalog_validation.ci.utils import get_app_version
+
         return get_app_version(self.path)
 
     @property
     def image_schema(self) -> dict:
-        return {
-            'type': 'object',
-            'properties': {
-                'repository': {
-                    'type': 'string',
-                },
-                'tag': {
-                    'type': 'string',
-                },
-            },
-            'required': ['repository', 'tag'],
-        }
+        return IMAGE_SCHEMA
 
     @property
     def upgrade_strategy_output_schema(self) -> dict:
-        return {
-            'type': 'object',
-            'properties': {
-                'tags': {
-                    'type': 'object',
-                },
-                'app_version': {
-                    'type': ['string', 'null'],
-                },
-            },
-            'required': ['tags'],
-        }
+        return UPGRADE_STRATEGY_OUTPUT_SCHEMA
+
+    def image_tags(self, image: str, tag_filter: Optional[TagFilter] = None) -> tuple:
+        with span('image_tags', 'phase', item=self.name, image=image) as details:
+            try:
+                tags = get_image_tags(image, tag_filter)['Tags']
+            except (subprocess.CalledProcessError, RegistryError) as e:
+                details['error'] = str(e)
+                return [], f'Failed to retrieve available image tags: {e}'
+            else:
+                details['tags'] = len(tags)
+                return tags, None
 
     def upgrade_summary(self) -> dict:
+        # Decision is reused if none of the inputs of the upgrade strategy changed since it was last made, in that
+        # case we only compare hashes and do not parse any yaml file or run the upgrade strategy
+        strategy_cache = get_strategy_cache()
+        files_hash = None
+        if strategy_cache:
+            try:
+                upgrade_info = self.upgrade_info()
+            except ValidationException:
+                upgrade_info = None
+            if upgrade_info:
+                # In-process strategies are only named in upgrade info, so their code is fingerprinted separately
+                files_hash = files_digest(
+                    self.path, ['upgrade_info.json', upgrade_info['filename'], 'upgrade_strategy'],
+                    upgrade_strategy_version(upgrade_info['strategy']) if upgrade_info.get('strategy') else None,
+                )
+                entry = strategy_cache.get(self.path, files_hash)
+                summary = self.cached_upgrade_summary(entry) if entry else None
+                if summary:
+                    return summary
+
+        summary = self.evaluate_upgrade_summary()
+        keys_details = summary['upgrade_details']['keys']
+        images = {k: str(v['value']['repository']) for k, v in keys_details.items() if v['current_tag'] is not None}
+        # Failures to retrieve image tags or to run the upgrade strategy might be temporary, so only decisions
+        # made with complete inputs are kept
+        if files_hash and summary['error'] in (None, 'No update available') and not any(
+            keys_details[k]['error'] for k in images
+        ):
+            # Parsed values are left out as they might not be serializable and belong to the document which is
+            # patched later, available tags are filled in again when the decision is reused
+            cached_keys = {
+                k: {
+                    'current_tag': None if v['current_tag'] is None else str(v['current_tag']),
+                    'latest_tag': v['latest_tag'],
+                    'error': v['error'],
+                    'available_tags': [],
+                } for k, v in keys_details.items()
+            }
+            strategy_cache.add(
+                self.path, files_hash, images, {k: tags_digest(keys_details[k]['available_tags']) for k in images}, {
+                    **summary, 'upgrade_details': {**summary['upgrade_details'], 'keys': cached_keys},
+                },
+            )
+
+        return summary
+
+    def cached_upgrade_summary(self, entry: dict) -> Optional[dict]:
+        images = entry['images']
+        tag_filters = self.tag_filters(self.upgrade_info())
+        tags = {}
+        for key, (key_tags, error) in zip(images, (self.executor.map if self.executor else map)(
+            self.image_tags, images.values(), [tag_filters.get(k) for k in images]
+        )):
+            if error or tags_digest(key_tags) != entry['tags'].get(key):
+                return None
+            tags[key] = key_tags
+
+        with span('strategy_cache_hit', 'phase', item=self.name):
+            summary = copy.deepcopy(entry['summary'])
+            summary['latest_version'] = self.latest_version
+            for key, key_tags in tags.items():
+                summary['upgrade_details']['keys'][key]['available_tags'] = key_tags
+
+        return summary
+
+    def evaluate_upgrade_summary(self) -> dict:
         keys_details = defaultdict(lambda: {
             'value': None,
             'available_tags': [],
@@ -136,26 +312,28 @@ class Item:
                 'test_filename': None,
             }
         }
+        try:
+            upgrade_info = self.upgrade_info()
+        except ValidationException as e:
+            summary['error'] = str(e)
+            return summary
+
         missing_files = []
-        if not self.upgrade_info_defined:
+        if not upgrade_info:
             missing_files.append(self.upgrade_info_path)
-        if not self.upgrade_strategy_defined:
+        # An executable upgrade strategy is not required if upgrade info specifies an in-process strategy
+        # or built-in strategies for keys
+        if not any(k in (upgrade_info or {}) for k in ('strategy', 'strategies')) and not self.upgrade_strategy_defined:
             missing_files.append(self.upgrade_strategy_path)
 
         if missing_files:
             summary['error'] = f'Missing {", ".join(missing_files)} required files'
             return summary
 
-        try:
-            upgrade_info = self.upgrade_info()
-        except ValidationException as e:
-            summary['error'] = str(e)
-            return summary
-
         values_file = os.path.join(self.path, upgrade_info['filename'])
         summary['upgrade_details']['filename'] = upgrade_info['filename']
         summary['upgrade_details']['test_filename'] = upgrade_info.get('test_filename')
-        if not os.path.exists(values_file):
+        if not self.file_exists(upgrade_info['filename']):
             summary['error'] = f'{values_file!r} count not be found'
             return summary
 
@@ -163,51 +341,50 @@ class Item:
             summary['error'] = f'No keys listed in {self.upgrade_info_path!r} for upgrade check'
             return summary
 
-        with open(values_file, 'r') as f:
-            try:
-                values = self.YAML.load(f.read())
-            except ruamel.yaml.scanner.ScannerError:
-                summary['error'] = f'{values_file!r} is an invalid yaml file'
-                return summary
+        from ruamel.yaml.scanner import ScannerError
+
+        try:
+            values = self.load_yaml(values_file)
+        except ScannerError:
+            summary['error'] = f'{values_file!r} is an invalid yaml file'
+            return summary
 
+        images = {}
         for key in upgrade_info['keys']:
             val = get(values, key)
             keys_details[key]['value'] = val
             if not val:
                 continue
             try:
-                json_schema_validate(val, self.image_schema)
-            except JsonValidationError as e:
+                IMAGE_VALIDATOR.validate(val)
+            except SchemaValidationError as e:
                 keys_details[key]['error'] = f'Image format is invalid: {e}'
                 continue
             else:
                 keys_details[key]['current_tag'] = val['tag']
+                images[key] = val['repository']
 
-            try:
-                keys_details[key]['available_tags'] = get_image_tags(val['repository'])['Tags']
-            except subprocess.CalledProcessError as e:
-                keys_details[key]['error'] = f'Failed to retrieve available image tags: {e}'
-            else:
-                keys_details[key]['error'] = None
+        # Image tags for all keys are retrieved concurrently if we have been given an executor to do so, tags
+        # are filtered as they are retrieved if upgrade info declares a filter for the key
+        tag_filters = self.tag_filters(upgrade_info)
+        for key, (tags, error) in zip(images, (self.executor.map if self.executor else map)(
+            self.image_tags, images.values(), [tag_filters.get(k) for k in images]
+        )):
+            keys_details[key].update({'available_tags': tags, 'error': error})
 
         # We have information on each available image now, let's pass it to upgrade strategy
-        with tempfile.NamedTemporaryFile(mode='w') as f:
-            f.write(json.dumps({k: v['available_tags'] for k, v in keys_details.items()}))
-            f.flush()
-            cp = run(f'cat {f.name} | {self.upgrade_strategy_path}', check=False, shell=True)
-            if cp.returncode:
-                summary['error'] = f'Failed to retrieve latest available image tag(s): {cp.stderr}'
-                return summary
-
         try:
-            strategy_output = json.loads(cp.stdout)
-        except json.JSONDecodeError:
-            summary['error'] = f'Expected json compliant output from {self.upgrade_strategy_path}'
+            with span('upgrade_strategy', 'phase', item=self.name):
+                strategy_output = self.run_upgrade_strategy(
+                    upgrade_info, {k: v['available_tags'] for k, v in keys_details.items()}, images
+                )
+        except UpgradeStrategyError as e:
+            summary['error'] = str(e)
             return summary
 
         try:
-            json_schema_validate(strategy_output, self.upgrade_strategy_output_schema)
-        except JsonValidationError as e:
+            UPGRADE_STRATEGY_OUTPUT_VALIDATOR.validate(strategy_output)
+        except SchemaValidationError as e:
             summary['error'] = f'Unexpected output format specified by upgrade strategy: {e}'
             return summary
 
@@ -227,61 +404,150 @@ class Item:
 
         return summary
 
+    def run_upgrade_strategy(
+        self, upgrade_info: dict, available_tags: dict, repositories: Optional[dict] = None
+    ) -> dict:
+        if 'strategies' in upgrade_info:
+            try:
+                return evaluate_strategies(
+                    upgrade_info['strategies'], available_tags, upgrade_info.get('app_version_key'), repositories
+                )
+            except re.error as e:
+                raise UpgradeStrategyError(f'Invalid pattern specified for built-in upgrade strategy: {e}')
+
+        if upgrade_info.get('strategy'):
+            try:
+                strategy = load_upgrade_strategy(upgrade_info['strategy'])
+            except Exception as e:
+                raise UpgradeStrategyError(f'Unable to load {upgrade_info["strategy"]!r} upgrade strategy: {e}')
+
+            try:
+                return strategy(available_tags)
+            except Exception as e:
+                raise UpgradeStrategyError(f'Failed to retrieve latest available image tag(s): {e}')
+
+        with tempfile.NamedTemporaryFile(mode='w') as f:
+            f.write(json.dumps(available_tags))
+            f.flush()
+            with span('upgrade_strategy_process', 'process', item=self.name) as details:
+                cp = run(f'cat {f.name} | {self.upgrade_strategy_path}', check=False, shell=True)
+                details['returncode'] = cp.returncode
+            if cp.returncode:
+                raise UpgradeStrategyError(f'Failed to retrieve latest available image tag(s): {cp.stderr}')
+
+        try:
+            return json.loads(cp.stdout)
+        except json.JSONDecodeError:
+            raise UpgradeStrategyError(f'Expected json compliant output from {self.upgrade_strategy_path}')
+
+    def load_yaml(self, path: str):
+        if path not in self.documents:
+            with span('yaml_load', 'phase', item=self.name, file=os.path.basename(path)):
+                with open(path, 'r') as f:
+                    contents = f.read()
+                self.documents[path] = self.YAML.load(contents)
+            self.contents[path] = contents
+
+        return self.documents[path]
+
+    def dump_yaml(self, path: str, document) -> bool:
+        with span('yaml_dump', 'phase', item=self.name, file=os.path.basename(path)) as details:
+            stream = io.StringIO()
+            self.YAML.dump(document, stream)
+            contents = stream.getvalue()
+            details['written'] = contents != self.contents.get(path)
+            if not details['written']:
+                return False
+
+            write_file(path, contents)
+            self.contents[path] = contents
+            return True
+
+    def patch_yaml(self, path: str, document, changes: list) -> bool:
+        # Only the scalars of (mapping, key, value) changes are rewritten in place, which is much cheaper than dumping
+        # large documents and leaves every other line as it is. The whole document is dumped only if any of them could
+        # not be located unambiguously in the file.
+        with span('yaml_patch', 'phase', item=self.name, file=os.path.basename(path)) as details:
+            contents = patch_scalars(self.contents[path], changes)
+            details['patched'] = contents is not None
+
+        for mapping, key, value in changes:
+            mapping[key] = value
+
+        if contents is None:
+            written = self.dump_yaml(path, document)
+        elif contents != self.contents[path]:
+            write_file(path, contents)
+            self.contents[path] = contents
+            written = True
+        else:
+            written = False
+
+        if written:
+            # Position marks of the document no longer match the file
+            self.documents.pop(path, None)
+        return written
+
     @property
     def bump_version(self) -> str:
-        v = parse_version(self.latest_version)
-        return str(parse_version(f'{v.major}.{v.minor}.{v.micro + 1}'))
+        v = Version(self.latest_version)
+        return str(Version(f'{v.major}.{v.minor}.{v.micro + 1}'))
 
     def upgrade(self) -> dict:
-        self.YAML.indent(mapping=2, sequence=4, offset=2)
         summary = self.upgrade_summary()
         if summary['error']:
             return summary
 
-        new_version = self.bump_version
+        return self.apply_upgrade(summary, self.bump_version)
 
-        with open(os.path.join(self.path, summary['upgrade_details']['filename']), 'r') as f:
-            values = self.YAML.load(f.read())
+    def apply_upgrade(self, summary: dict, new_version: str) -> dict:
+        # Summary can either come from upgrade_summary() or from a previously generated plan, it only needs
+        # filename(s), new app version and current/latest tags of the keys
+        self.YAML.indent(mapping=2, sequence=4, offset=2)
+        changed_files = []
+        values_path = os.path.join(self.path, summary['upgrade_details']['filename'])
+        values = self.load_yaml(values_path)
 
+        changes = []
         for key, value in summary['upgrade_details']['keys'].items():
             if value['error'] or value['latest_tag'] == value['current_tag']:
                 continue
-            image = get(values, key)
-            image['tag'] = value['latest_tag']
+            changes.append((get(values, key), 'tag', value['latest_tag']))
 
-        with open(os.path.join(self.path, summary['upgrade_details']['filename']), 'w') as f:
-            self.YAML.dump(values, f)
+        if self.patch_yaml(values_path, values, changes):
+            changed_files.append(values_path)
 
-        test_values_path = os.path.join(self.path, summary['upgrade_details']['test_filename'] or '')
-        if summary['upgrade_details']['test_filename'] and os.path.exists(test_values_path):
-            with open(os.path.join(test_values_path), 'r') as f:
-                test_values = self.YAML.load(f.read())
+        test_filename = summary['upgrade_details']['test_filename']
+        test_values_path = os.path.join(self.path, test_filename or '')
+        if test_filename and self.file_exists(test_filename):
+            test_values = self.load_yaml(test_values_path)
 
+            changes = []
             for key, value in summary['upgrade_details']['keys'].items():
                 if value['error'] or value['latest_tag'] == value['current_tag']:
                     continue
                 image = get(test_values, key)
                 if not image:
                     continue
-                image['tag'] = value['latest_tag']
+                changes.append((image, 'tag', value['latest_tag']))
 
-            with open(test_values_path, 'w') as f:
-                self.YAML.dump(test_values, f)
+            if self.patch_yaml(test_values_path, test_values, changes):
+                changed_files.append(test_values_path)
 
         chart_file_path = os.path.join(self.path, 'Chart.yaml')
-        with open(chart_file_path, 'r') as f:
-            chart = self.YAML.load(f.read())
+        chart = self.load_yaml(chart_file_path)
 
-        chart['version'] = new_version
+        changes = [(chart, 'version', new_version)]
         if summary['upgrade_details']['new_app_version']:
-            chart['appVersion'] = summary['upgrade_details']['new_app_version']
+            changes.append((chart, 'appVersion', summary['upgrade_details']['new_app_version']))
 
-        with open(chart_file_path, 'w') as f:
-            self.YAML.dump(chart, f)
+        if self.patch_yaml(chart_file_path, chart, changes):
+            changed_files.append(chart_file_path)
 
         summary.update({
             'upgraded': True,
             'new_version': new_version,
             'new_version_path': self.path,
+            'changed_files': changed_files,
         })
         return summary
@@ -1,10 +1,22 @@
-import json
+import shutil
 import subprocess
+import threading
+
+from typing import Optional
+
+from .exceptions import RegistryError, RegistryRateLimited
+from .profiling import span
+from .registry_endpoints import get_registry_endpoints
+from .tag_cache import get_tag_cache
+from .tag_filter import TAGS_CHUNK_SIZE, TagCollector, TagFilter, TagStream
+from .tag_snapshot import get_tag_snapshot
 
 
 DEFAULT_DOCKER_REGISTRY = 'docker.io'
 DEFAULT_DOCKER_REPO = 'library'
 DEFAULT_DOCKER_TAG = 'latest'
+TAGS_BACKENDS = ('registry', 'skopeo')
+TAGS_BACKEND = 'registry'
 
 
 def parse_image_tag(tag: str) -> dict[str, str]:
@@ -31,14 +43,112 @@ def parse_image_tag(tag: str) -> dict[str, str]:
     }
 
 
-def get_image_tags(image_name: str) -> dict:
+def resolve_image(image_name: str) -> tuple:
+    # (registry, image) tags of the image are looked up from once registry rewrites are applied
     image_details = parse_image_tag(image_name)
-    cp = subprocess.Popen(
-        ['skopeo', 'list-tags', '--no-creds', f'docker://{image_details["registry"]}/{image_details["image"]}'],
-        stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    )
-    stdout, stderr = cp.communicate()
-    if cp.returncode:
-        raise subprocess.CalledProcessError(cp.returncode, cp.args, stderr=stderr)
-
-    return json.loads(stdout)
+    return get_registry_endpoints().rewrite(image_details['registry'], image_details['image'])
+
+
+def get_image_tags(image_name: str, tag_filter: Optional[TagFilter] = None) -> dict:
+    registry, image = resolve_image(image_name)
+    snapshot = get_tag_snapshot()
+    if snapshot:
+        # Offline run, tags are only ever answered from the snapshot taken by fetch-tags
+        return snapshot.get(registry, image, tag_filter)
+    return get_tag_cache().get(registry, image, retrieve_image_tags, tag_filter)
+
+
+def get_tags_backend() -> str:
+    return TAGS_BACKEND
+
+
+def setup_tags_backend(backend: str) -> None:
+    global TAGS_BACKEND
+    if backend not in TAGS_BACKENDS:
+        raise ValueError(f'{backend!r} is not a valid tags backend')
+    TAGS_BACKEND = backend
+
+
+def retrieve_image_tags(
+    registry: str, image: str, known_tags: Optional[list] = None, tag_filter: Optional[TagFilter] = None,
+) -> dict:
+    # Mirrors of the registry are tried first within a shorter timeout, a mirror which is slow or unavailable
+    # fails over to the next endpoint and finally to the registry itself. Tags are always stored for the image
+    # itself along with the endpoint which served them.
+    endpoints = get_registry_endpoints()
+    for mirror, endpoint_registry, endpoint_image in endpoints.endpoints(registry, image):
+        if mirror is None:
+            tags = retrieve_endpoint_tags(registry, image, known_tags, tag_filter)
+            break
+        try:
+            tags = retrieve_endpoint_tags(
+                endpoint_registry, endpoint_image, known_tags, tag_filter, endpoints.mirror_timeout,
+            )
+        except (subprocess.CalledProcessError, RegistryError):
+            endpoints.failed(mirror)
+        else:
+            endpoints.succeeded(mirror)
+            break
+
+    return {**tags, 'Repository': f'{registry}/{image}', 'Endpoint': f'{endpoint_registry}/{endpoint_image}'}
+
+
+def retrieve_endpoint_tags(
+    registry: str, image: str, known_tags: Optional[list] = None, tag_filter: Optional[TagFilter] = None,
+    timeout: Optional[float] = None,
+) -> dict:
+    # known_tags are the tags we already retrieved for the image earlier, which allows the registry
+    # backend to only retrieve tags added since then. skopeo has no such support and lists everything.
+    if TAGS_BACKEND == 'skopeo':
+        return retrieve_image_tags_with_skopeo(registry, image, tag_filter, timeout)
+
+    # Registry client is imported here as aiohttp/asyncio noticeably slow down start up and are not required at all
+    # when tags are retrieved with skopeo
+    from .registry import get_registry_client
+
+    try:
+        with span('registry_lookup', 'lookup', registry=registry, image=image) as details:
+            tags = get_registry_client().get_image_tags(registry, image, known_tags, tag_filter, timeout)
+            details.update({'incremental': bool(known_tags), 'tags': len(tags['Tags'])})
+            return tags
+    except RegistryRateLimited:
+        # skopeo would be talking to the same registry which has asked us to back off
+        raise
+    except RegistryError:
+        # skopeo is kept as a fallback as it might be able to reach registries with a setup we do not
+        # support natively i.e credentials / certificates configured for containers tooling. Mirrors fail
+        # over to the next endpoint instead.
+        if timeout or not shutil.which('skopeo'):
+            raise
+        return retrieve_image_tags_with_skopeo(registry, image, tag_filter)
+
+
+def retrieve_image_tags_with_skopeo(
+    registry: str, image: str, tag_filter: Optional[TagFilter] = None, timeout: Optional[float] = None,
+) -> dict:
+    with span('skopeo_lookup', 'lookup', registry=registry, image=image) as details:
+        cp = subprocess.Popen(
+            ['skopeo', 'list-tags', '--no-creds', f'docker://{registry}/{image}'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        # skopeo is killed if it does not finish in time, which makes it fail like any other failed lookup
+        timer = threading.Timer(timeout, cp.kill) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            # Output is parsed as it is read so that only the tags kept by the filter are ever held in memory
+            stream, collector = TagStream('Tags'), TagCollector(tag_filter)
+            for chunk in iter(lambda: cp.stdout.read(TAGS_CHUNK_SIZE), b''):
+                collector.extend(stream.feed(chunk))
+            collector.extend(stream.feed(b'', final=True))
+            stderr = cp.communicate()[1]
+        finally:
+            if timer:
+                timer.cancel()
+        details['returncode'] = cp.returncode
+        if cp.returncode:
+            raise subprocess.CalledProcessError(cp.returncode, cp.args, stderr=stderr)
+
+        tags = collector.result()
+        details['tags'] = len(tags)
+        return {'Repository': f'{registry}/{image}', 'Tags': tags}
@@ -12,3 +12,28 @@ class CalledProcessError(subprocess.CalledProcessError):
     def __str__(self):
         resp = super().__str__()
         return f'{resp} with {self.stderr!r}' if self.stderr else resp
+
+
+class RegistryError(Exception):
+    def __init__(self, registry, image, error):
+        self.registry = registry
+        self.image = image
+        self.error = error
+        super().__init__(f'Failed to retrieve tags of {registry}/{image}: {error}')
+
+
+class RegistryRateLimited(RegistryError):
+    def __init__(self, registry, image, retry_after):
+        self.retry_after = retry_after
+        super().__init__(registry, image, f'Rate limit exceeded, retry after {int(retry_after)} seconds')
+
+
+class UpgradeStrategyError(Exception):
+    pass
+
+
+class GitHubError(Exception):
+    def __init__(self, status, error):
+        self.status = status
+        self.error = error
+        super().__init__(f'GitHub API request failed with {status}: {error}' if status else error)
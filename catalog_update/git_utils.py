@@ -1,51 +1,161 @@
+import json
+import os
+import shlex
+import subprocess
 import uuid
 
 from typing import Optional
 from urllib.parse import urlparse
 
+from .github import get_github_client, github_repository
+from .profiling import span
 from .utils import run
 
 
-def checkout_and_update_branch(path: str, branch: str) -> None:
+PR_BACKENDS = ('api', 'gh')
+PR_BACKEND = 'api'
+
+
+def git(path: str, *args, **kwargs) -> subprocess.CompletedProcess:
+    with span(f'git {args[0]}', 'git', path=path) as details:
+        cp = run(['git', '-C', path, *args], **kwargs)
+        details['returncode'] = cp.returncode
+    return cp
+
+
+def checkout_and_update_branch(
+    path: str, branch: str, depth: Optional[int] = None, fetch_filter: Optional[str] = None
+) -> None:
     checkout_branch(path, branch)
-    update_branch(path, branch)
+    update_branch(path, branch, depth, fetch_filter)
 
 
-def checkout_branch(path: str, branch: str, create: bool = False) -> None:
+def checkout_branch(path: str, branch: str, create: bool = False, reset: bool = False) -> None:
+    # reset creates the branch or resets it to the current commit if it already exists
     flags = []
     if create:
-        flags.append('-b')
+        flags.append('-B' if reset else '-b')
+
+    git(path, 'checkout', *flags, branch)
+
+
+def update_branch(path: str, branch: str, depth: Optional[int] = None, fetch_filter: Optional[str] = None) -> None:
+    # Only the branch we are going to reset to is fetched instead of every branch/tag of the repository
+    flags = [f'--depth={depth}'] if depth else []
+    if fetch_filter:
+        flags.append(f'--filter={fetch_filter}')
+    git(path, 'fetch', '--no-tags', *flags, 'origin', f'+refs/heads/{branch}:refs/remotes/origin/{branch}')
+    git(path, 'reset', '--hard', f'origin/{branch}')
+
+
+def get_changed_files(path: str, files: Optional[list] = None) -> list:
+    # Porcelain output with -z is `XY <path>\0`, renames/copies have the original path as an additional entry
+    entries = git(
+        path, 'status', '--porcelain', '-z', '--untracked-files=all', '--', *(pathspecs(path, files) if files else [])
+    ).stdout.split('\0')
+    changed, skip = [], False
+    for entry in filter(None, entries):
+        if skip:
+            skip = False
+            continue
+        changed.append(entry[3:])
+        skip = entry[0] in 'RC'
+
+    return changed
+
+
+def pathspecs(path: str, files: list) -> list:
+    return [os.path.relpath(os.path.abspath(f), os.path.abspath(path)) for f in files]
+
+
+def commit_changes(path: str, commit_msg: str, username: str, email: str, files: Optional[list] = None) -> None:
+    # If we know which files have been changed, only those are staged instead of everything in the working tree
+    # Identity is specified for the commit only as git config is shared by all worktrees of the repository
+    # and concurrent commits in different worktrees would otherwise race on updating it
+    env = {
+        **os.environ, 'GIT_AUTHOR_NAME': username, 'GIT_AUTHOR_EMAIL': email,
+        'GIT_COMMITTER_NAME': username, 'GIT_COMMITTER_EMAIL': email,
+    }
+    if files is None:
+        git(path, 'add', '.')
+    else:
+        changed_files = get_changed_files(path, files)
+        if not changed_files:
+            raise ValueError('None of the specified files have been changed')
+        git(
+            path, 'add', '--pathspec-from-file=-', '--pathspec-file-nul',
+            input='\0'.join(':(top,literal)' + f for f in changed_files),
+        )
+    git(path, 'commit', '-m', commit_msg, env=env)
+
+
+def push_changes(path: str, api_token: str, branch: str, origin_uri: Optional[None], force: bool = False) -> None:
+    url = urlparse(origin_uri or get_origin_uri(path))
+    git(path, 'push', *(['--force'] if force else []), f'https://{api_token}@{url.hostname}{url.path}', branch)
 
-    run(['git', '-C', path, 'checkout'] + flags + [branch])
 
+def add_worktree(path: str, worktree_path: str, start_point: str) -> None:
+    # Worktrees share the object store of the repository, so no objects are fetched/copied for them
+    git(path, 'worktree', 'add', '--detach', worktree_path, start_point)
 
-def update_branch(path: str, branch: str) -> None:
-    run(['git', '-C', path, 'fetch', 'origin'])
-    run(['git', '-C', path, 'reset', '--hard', f'origin/{branch}'])
 
+def remove_worktree(path: str, worktree_path: str) -> None:
+    git(path, 'worktree', 'remove', '--force', worktree_path)
+    git(path, 'worktree', 'prune')
 
-def commit_changes(path: str, commit_msg: str, username: str, email: str) -> None:
-    run(['git', '-C', path, 'config', 'user.name', username])
-    run(['git', '-C', path, 'config', 'user.email', email])
-    run(['git', '-C', path, 'add', '.'])
-    run(['git', '-C', path, 'commit', '-m', commit_msg])
 
+def get_origin_uri(path: str) -> str:
+    return git(path, 'remote', 'get-url', 'origin').stdout.strip()
 
-def push_changes(path: str, api_token: str, branch: str, origin_uri: Optional[None]) -> None:
-    url = urlparse(origin_uri or get_origin_uri(path))
-    run(['git', '-C', path, 'push', f'https://{api_token}@{url.hostname}{url.path}', branch])
 
+def get_commit_message(path: str, ref: str) -> tuple:
+    subject, _, body = git(path, 'log', '-1', '--format=%B', ref).stdout.strip().partition('\n')
+    return subject, body.strip()
 
-def get_origin_uri(path: str) -> str:
-    return run(['git', '-C', path, 'remote', 'get-url', 'origin']).stdout.strip()
+
+def setup_pr_backend(backend: str) -> None:
+    global PR_BACKEND
+    if backend not in PR_BACKENDS:
+        raise ValueError(f'{backend!r} is not a valid pull request backend')
+    PR_BACKEND = backend
+
+
+def github_client_repo(path: str, config: dict) -> tuple:
+    return (
+        get_github_client(config['GITHUB_TOKEN'], config.get('GITHUB_API_URL')),
+        github_repository(config.get('GITHUB_ORIGIN') or get_origin_uri(path)),
+    )
 
 
 def create_pull_request(
     path: str, base_branch: str, branch: str, reviewers: Optional[list], config: Optional[dict] = None
 ) -> None:
+    if PR_BACKEND == 'api':
+        # Like gh pr create --fill, title and body of the PR are taken from the commit on the branch
+        client, repo = github_client_repo(path, config or os.environ)
+        client.create_pull_request(repo, base_branch, branch, *get_commit_message(path, branch), reviewers)
+        return
+
     review_args = f' -r {",".join(reviewers)}' if reviewers else ''
     run(f'cd {path} && gh pr create -f -B {base_branch} -H {branch}{review_args}', shell=True, env=config)
 
 
+def pull_request_exists(path: str, branch: str, config: Optional[dict] = None) -> bool:
+    if PR_BACKEND == 'api':
+        client, repo = github_client_repo(path, config or os.environ)
+        return client.pull_request_exists(repo, branch)
+
+    cp = run(
+        f'cd {shlex.quote(path)} && gh pr list --state open --head {shlex.quote(branch)} --json number',
+        shell=True, env=config,
+    )
+    return bool(json.loads(cp.stdout or '[]'))
+
+
 def generate_branch_name():
     return f'catalog-update-{str(uuid.uuid4())[-4:]}'
+
+
+def generate_app_branch_name(train: str, item: str) -> str:
+    # Branch name of an app is stable so that an open branch/PR for the app is updated instead of duplicated
+    return f'catalog-update-{train}-{item}'
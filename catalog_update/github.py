@@ -0,0 +1,210 @@
+import itertools
+import random
+import re
+import threading
+import time
+
+from typing import Optional, TYPE_CHECKING
+
+from .exceptions import GitHubError
+from .registry_scheduler import BACKOFF_BASE, BACKOFF_CAP, rate_limit_delay
+
+if TYPE_CHECKING:
+    import aiohttp
+
+
+DEFAULT_GITHUB_API_URL = 'https://api.github.com'
+DEFAULT_GITHUB_RETRIES = 4
+DEFAULT_GITHUB_MAX_WAIT = 300
+# GitHub asks to wait at least a minute after hitting a secondary rate limit which does not specify a wait
+SECONDARY_RATE_LIMIT_WAIT = 60
+# Requests creating content are sent one at a time this many seconds apart to avoid secondary rate limits
+MUTATION_INTERVAL = 1
+RETRY_STATUSES = (500, 502, 503, 504)
+GITHUB_REPO_RE = re.compile(r'^(?:[\w+.-]+://)?(?:[^@/]+@)?[^:/]+[:/](?P<repo>[^/]+/[^/]+?)(?:\.git)?/?$')
+
+
+def github_repository(origin_uri: str) -> str:
+    # owner/repo of https://github.com/owner/repo.git, git@github.com:owner/repo.git and similar remote urls
+    match = GITHUB_REPO_RE.match(origin_uri.strip())
+    if not match:
+        raise GitHubError(None, f'Unable to determine GitHub repository of {origin_uri!r}')
+    return match.group('repo')
+
+
+def rate_limited(status: int, headers, error: str) -> bool:
+    if status not in (403, 429):
+        return False
+    return status == 429 or 'Retry-After' in headers or headers.get('X-RateLimit-Remaining') == '0' or (
+        'rate limit' in error.lower()
+    )
+
+
+class GitHubClient:
+    # Client for the GitHub REST API. Requests run on an event loop in a dedicated thread so that callers from any
+    # thread share a single pooled session, requests creating content are serialized as GitHub recommends and
+    # requests hitting (secondary) rate limits are retried after the wait GitHub asks for.
+
+    def __init__(
+        self, token: str, api_url: str = DEFAULT_GITHUB_API_URL, timeout: int = 30,
+        retries: int = DEFAULT_GITHUB_RETRIES, max_wait: int = DEFAULT_GITHUB_MAX_WAIT,
+    ):
+        self.token = token
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.http_session = None
+        self.mutation_lock = None
+        self.mutated_at = 0
+
+    def run(self, coro):
+        # asyncio is imported where it is used as it noticeably slows down start up and is only required when
+        # pull requests are handled through the API
+        import asyncio
+
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name='github-client', daemon=True)
+                self.thread.start()
+
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.loop is None:
+                return
+
+            import asyncio
+
+            asyncio.run_coroutine_threadsafe(self.close_session(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.loop = self.thread = None
+
+    async def close_session(self) -> None:
+        session, self.http_session, self.mutation_lock = self.http_session, None, None
+        if session:
+            await session.close()
+
+    def session(self) -> 'aiohttp.ClientSession':
+        import asyncio
+        import aiohttp
+
+        if self.http_session is None:
+            self.http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout), headers={
+                'Accept': 'application/vnd.github+json',
+                'Authorization': f'Bearer {self.token}',
+                'User-Agent': 'catalog_update',
+                'X-GitHub-Api-Version': '2022-11-28',
+            })
+            self.mutation_lock = asyncio.Lock()
+        return self.http_session
+
+    def pull_request_exists(self, repo: str, branch: str) -> bool:
+        return self.run(self.find_pull(repo, branch)) is not None
+
+    def create_pull_request(
+        self, repo: str, base: str, branch: str, title: str, body: str, reviewers: Optional[list] = None
+    ) -> dict:
+        return self.run(self.create_pull(repo, base, branch, title, body, reviewers))
+
+    async def find_pull(self, repo: str, branch: str) -> Optional[dict]:
+        # Branches are pushed to the repository itself, so the head of their PRs is owned by the repository owner
+        pulls = await self.request('GET', f'/repos/{repo}/pulls', params={
+            'state': 'open', 'head': f'{repo.split("/")[0]}:{branch}',
+        })
+        return pulls[0] if pulls else None
+
+    async def create_pull(
+        self, repo: str, base: str, branch: str, title: str, body: str, reviewers: Optional[list] = None
+    ) -> dict:
+        try:
+            pull = await self.request('POST', f'/repos/{repo}/pulls', json={
+                'title': title, 'body': body, 'head': branch, 'base': base,
+            })
+        except GitHubError as e:
+            # PR might have been created by an earlier attempt whose response we did not get
+            pull = await self.find_pull(repo, branch) if e.status == 422 else None
+            if not pull:
+                raise
+
+        if reviewers:
+            await self.request(
+                'POST', f'/repos/{repo}/pulls/{pull["number"]}/requested_reviewers', json={'reviewers': reviewers}
+            )
+        return pull
+
+    async def request(self, method: str, path: str, **kwargs):
+        import asyncio
+
+        if method == 'GET':
+            return await self.send(method, path, **kwargs)
+
+        self.session()
+        async with self.mutation_lock:
+            await asyncio.sleep(max(self.mutated_at + MUTATION_INTERVAL - time.monotonic(), 0))
+            try:
+                return await self.send(method, path, **kwargs)
+            finally:
+                self.mutated_at = time.monotonic()
+
+    async def send(self, method: str, path: str, **kwargs):
+        import asyncio
+        import aiohttp
+
+        for attempt in itertools.count():
+            delay = None
+            try:
+                async with self.session().request(method, f'{self.api_url}{path}', **kwargs) as resp:
+                    if resp.status < 300:
+                        return await resp.json(content_type=None) if resp.status != 204 else None
+
+                    error = await resp.text()
+                    status = resp.status
+                    if rate_limited(status, resp.headers, error):
+                        delay = rate_limit_delay(resp.headers)
+                        if delay is None:
+                            delay = SECONDARY_RATE_LIMIT_WAIT * 2 ** attempt
+                    elif status not in RETRY_STATUSES:
+                        raise GitHubError(status, error)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                status, error = None, str(e) or repr(e)
+            except (aiohttp.ClientError, ValueError) as e:
+                raise GitHubError(None, str(e) or repr(e))
+
+            if attempt >= self.retries:
+                raise GitHubError(status, error)
+
+            wait = delay if delay is not None else random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            if wait > self.max_wait:
+                raise GitHubError(status, f'Rate limit exceeded, retry after {int(wait)} seconds')
+            await asyncio.sleep(wait)
+
+
+GITHUB_CLIENT = None
+GITHUB_CLIENT_LOCK = threading.Lock()
+
+
+def get_github_client(token: str, api_url: Optional[str] = None) -> GitHubClient:
+    global GITHUB_CLIENT
+    api_url = (api_url or DEFAULT_GITHUB_API_URL).rstrip('/')
+    with GITHUB_CLIENT_LOCK:
+        if GITHUB_CLIENT is None or (GITHUB_CLIENT.token, GITHUB_CLIENT.api_url) != (token, api_url):
+            if GITHUB_CLIENT is not None:
+                GITHUB_CLIENT.close()
+            GITHUB_CLIENT = GitHubClient(token, api_url)
+        return GITHUB_CLIENT
+
+
+def close_github_client() -> None:
+    global GITHUB_CLIENT
+    with GITHUB_CLIENT_LOCK:
+        if GITHUB_CLIENT is not None:
+            GITHUB_CLIENT.close()
+            GITHUB_CLIENT = None
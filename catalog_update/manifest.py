@@ -0,0 +1,63 @@
+import json
+import os
+
+from .exceptions import ValidationException
+from .schema import SchemaValidationError, SchemaValidator
+
+
+MANIFEST_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'catalogs': {
+            'type': 'array',
+            'minItems': 1,
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'path': {'type': 'string'},
+                    'base_branch': {'type': 'string'},
+                    'reviewers': {'type': 'array', 'items': {'type': 'string'}},
+                },
+                'required': ['path'],
+                'additionalProperties': False,
+            },
+        },
+    },
+    'required': ['catalogs'],
+}
+MANIFEST_VALIDATOR = SchemaValidator(MANIFEST_SCHEMA)
+
+
+def catalog_repo_path(catalog_path: str) -> str:
+    return catalog_path.replace('/library/ix-dev', '')
+
+
+def load_manifest(path: str) -> list:
+    try:
+        with open(path, 'r') as f:
+            manifest = json.loads(f.read())
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValidationException(f'Unable to read manifest from {path!r}: {e}')
+
+    try:
+        MANIFEST_VALIDATOR.validate(manifest)
+    except SchemaValidationError as e:
+        raise ValidationException(f'Manifest failed validation: {e}')
+
+    # Catalog paths are relative to the manifest so that it can be kept alongside the catalog repositories
+    catalogs = [
+        {**catalog, 'path': os.path.join(os.path.dirname(os.path.abspath(path)), catalog['path'])}
+        for catalog in manifest['catalogs']
+    ]
+    validate_catalogs([catalog['path'] for catalog in catalogs])
+    return catalogs
+
+
+def validate_catalogs(catalog_paths: list) -> None:
+    # Every catalog is checked out on its own branch, so two catalogs can not live in the same repository
+    repo_paths = [os.path.normpath(catalog_repo_path(os.path.abspath(p))) for p in catalog_paths]
+    duplicates = sorted({p for p in repo_paths if repo_paths.count(p) > 1})
+    if duplicates:
+        raise ValidationException(
+            f'Catalogs of {", ".join(map(repr, duplicates))} repository are specified more than once'
+        )
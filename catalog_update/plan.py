@@ -0,0 +1,190 @@
+import json
+import os
+import time
+
+from concurrent.futures import Executor
+from typing import Optional
+
+from .catalog_index import find_item_record
+from .catalog_item import Item
+from .exceptions import ValidationException
+from .schema import SchemaValidationError, SchemaValidator
+from .selection import get_item_selection
+from .update import apply_item_upgrade, plan_item, schedule_items_in_train, summarize_items
+from .utils import write_json
+
+
+PLAN_VERSION = 1
+PLAN_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'version': {'type': 'integer', 'const': PLAN_VERSION},
+        'catalog_path': {'type': 'string'},
+        'created_at': {'type': 'number'},
+        'selection': {
+            'type': ['object', 'null'],
+            'properties': {
+                'trains': {'type': 'array', 'items': {'type': 'string'}},
+                'items': {'type': 'array', 'items': {'type': 'string'}},
+                'shard': {
+                    'type': ['object', 'null'],
+                    'properties': {
+                        'index': {'type': 'integer', 'minimum': 0},
+                        'count': {'type': 'integer', 'minimum': 1},
+                    },
+                    'required': ['index', 'count'],
+                },
+            },
+        },
+        'items': {
+            'type': 'object',
+            'additionalProperties': {
+                'type': 'object',
+                'properties': {
+                    'train': {'type': 'string'},
+                    'item': {'type': 'string'},
+                    'error': {'type': ['string', 'null']},
+                    'latest_version': {'type': ['string', 'null']},
+                    'new_version': {'type': ['string', 'null']},
+                    'upgrade_details': {'type': ['object', 'null']},
+                },
+                'required': ['train', 'item', 'error'],
+            },
+        },
+    },
+    'required': ['version', 'items'],
+}
+PLAN_VALIDATOR = SchemaValidator(PLAN_SCHEMA)
+
+
+def plan_entry(train: str, item: str, summary: dict) -> dict:
+    # Plan only keeps what is required to apply the upgrade later, available image tags and parsed values are
+    # left out as they can be huge and are not required anymore once the latest tags have been decided
+    upgrade_details = summary.get('upgrade_details')
+    if upgrade_details:
+        upgrade_details = {
+            **upgrade_details,
+            'keys': {
+                k: {'current_tag': v['current_tag'], 'latest_tag': v['latest_tag'], 'error': v['error']}
+                for k, v in upgrade_details['keys'].items()
+            },
+        }
+    return {
+        'train': train,
+        'item': item,
+        'error': summary['error'],
+        'latest_version': summary.get('latest_version'),
+        'new_version': summary.get('new_version'),
+        'upgrade_details': upgrade_details,
+    }
+
+
+def schedule_plan_in_train(
+    train_path: str, executor: Optional[Executor] = None, tags_executor: Optional[Executor] = None
+):
+    return schedule_items_in_train(train_path, executor, tags_executor, plan_item)
+
+
+def generate_plan(catalog_path: str, scheduled_trains: list) -> dict:
+    items = {}
+    for train, scheduled_items in scheduled_trains:
+        for item_path, summary in scheduled_items:
+            item = os.path.basename(item_path)
+            items[f'{train}/{item}'] = plan_entry(train, item, summary)
+
+    return {
+        'version': PLAN_VERSION,
+        'catalog_path': catalog_path,
+        'created_at': time.time(),
+        'selection': get_item_selection().to_dict(),
+        'items': items,
+    }
+
+
+def merge_plans(plans: list) -> dict:
+    # Plans of shards are combined into a single plan so that they can be applied in a single commit / PR
+    selections = [p.get('selection') or {} for p in plans]
+    filters = {(tuple(s.get('trains') or []), tuple(s.get('items') or [])) for s in selections}
+    shards = [s.get('shard') for s in selections]
+    if any(shards):
+        if not all(shards) or len({s['count'] for s in shards}) != 1 or len(filters) != 1:
+            raise ValidationException('Plans of different shardings or item selections cannot be merged')
+
+        indexes = [s['index'] for s in shards]
+        if len(set(indexes)) != len(indexes):
+            raise ValidationException('Plans of the same shard cannot be merged')
+
+        count = shards[0]['count']
+        missing = sorted(set(range(count)) - set(indexes))
+        if missing:
+            raise ValidationException(f'Plans of shard(s) {", ".join(f"{i}/{count}" for i in missing)} are missing')
+
+    items = {}
+    for plan in plans:
+        duplicates = sorted(set(items) & set(plan['items']))
+        if duplicates:
+            raise ValidationException(f'{", ".join(duplicates)} item(s) are planned more than once')
+        items.update(plan['items'])
+
+    trains, item_patterns = filters.pop() if len(filters) == 1 else ((), ())
+    return {
+        'version': PLAN_VERSION,
+        'catalog_path': plans[0].get('catalog_path'),
+        'created_at': min(p.get('created_at') or time.time() for p in plans),
+        'selection': {'trains': list(trains), 'items': list(item_patterns), 'shard': None},
+        'items': dict(sorted(items.items())),
+    }
+
+
+def write_plan(path: str, plan: dict) -> None:
+    write_json(path, plan)
+
+
+def load_plan(path: str) -> dict:
+    try:
+        with open(path, 'r') as f:
+            plan = json.loads(f.read())
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValidationException(f'Unable to read plan from {path!r}: {e}')
+
+    try:
+        PLAN_VALIDATOR.validate(plan)
+    except SchemaValidationError as e:
+        raise ValidationException(f'Plan failed validation: {e}')
+
+    return plan
+
+
+def apply_plan_item(catalog_path: str, entry: dict) -> dict:
+    if entry['error']:
+        return {'upgraded': False, 'error': entry['error']}
+
+    item_path = os.path.join(catalog_path, entry['train'], entry['item'])
+    item = Item(item_path, record=find_item_record(item_path))
+    if not item.exists:
+        return {'upgraded': False, 'error': f'{item.path!r} does not exist'}
+
+    # If the item has been changed since the plan was created, applying the plan would not be correct anymore
+    try:
+        latest_version = item.latest_version
+    except Exception as e:
+        return {'upgraded': False, 'error': f'Unable to determine item version: {e}'}
+
+    if latest_version != entry['latest_version']:
+        return {
+            'upgraded': False,
+            'error': f'Item version is {latest_version!r} instead of planned {entry["latest_version"]!r}',
+        }
+
+    return apply_item_upgrade(item, {**entry, 'upgraded': False})
+
+
+def apply_plan(catalog_path: str, plan: dict) -> dict:
+    # Applying a plan only edits yaml files, so there are no registry lookups or upgrade strategy runs here
+    trains = {}
+    for entry in sorted(plan['items'].values(), key=lambda e: (e['train'], e['item'])):
+        trains.setdefault(entry['train'], []).append(
+            (os.path.join(catalog_path, entry['train'], entry['item']), apply_plan_item(catalog_path, entry))
+        )
+
+    return {train: summarize_items(results) for train, results in trains.items()}
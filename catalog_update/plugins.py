@@ -0,0 +1,64 @@
+import functools
+import hashlib
+import importlib
+import importlib.util
+
+from typing import Callable
+
+
+UPGRADE_STRATEGIES_GROUP = 'catalog_update.upgrade_strategies'
+
+
+@functools.cache
+def load_upgrade_strategy(name: str) -> Callable[[dict], dict]:
+    # Upgrade strategy can either be the name of an entry point registered by an installed package in the
+    # catalog_update.upgrade_strategies group or an import path i.e `package.module:function`. It is loaded
+    # only once and then called in-process for every item using it.
+    if ':' in name:
+        module_name, attrs = name.split(':', 1)
+        strategy = importlib.import_module(module_name)
+        for attr in attrs.split('.'):
+            strategy = getattr(strategy, attr)
+    else:
+        # Binding importlib itself here would make it local to the whole function
+        from importlib.metadata import entry_points as get_entry_points
+
+        entry_points = get_entry_points(group=UPGRADE_STRATEGIES_GROUP, name=name)
+        if not entry_points:
+            raise LookupError(f'No {name!r} upgrade strategy registered in {UPGRADE_STRATEGIES_GROUP!r} group')
+        strategy = next(iter(entry_points)).load()
+
+    if not callable(strategy):
+        raise TypeError(f'{name!r} upgrade strategy is not callable')
+
+    return strategy
+
+
+@functools.cache
+def upgrade_strategy_version(name: str) -> str:
+    # Identifies the code of an upgrade strategy so that decisions it made are not reused once it changes, that is the
+    # version of the distribution registering it (if any) and a hash of the module defining it as editable installs
+    # keep their version while their code changes
+    digest = hashlib.sha256(name.encode() + b'\0')
+    if ':' in name:
+        module_name = name.split(':', 1)[0]
+    else:
+        from importlib.metadata import entry_points as get_entry_points
+
+        entry_points = get_entry_points(group=UPGRADE_STRATEGIES_GROUP, name=name)
+        if not entry_points:
+            return digest.hexdigest()
+        entry_point = next(iter(entry_points))
+        module_name = entry_point.module
+        if entry_point.dist:
+            digest.update(f'{entry_point.dist.name}=={entry_point.dist.version}\0'.encode())
+
+    try:
+        spec = importlib.util.find_spec(module_name)
+        if spec and spec.has_location:
+            with open(spec.origin, 'rb') as f:
+                digest.update(f.read())
+    except (ImportError, ValueError, OSError):
+        # Strategy fails to load when it is used, so the decision is not reused either way
+        pass
+    return digest.hexdigest()
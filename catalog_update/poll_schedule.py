@@ -0,0 +1,104 @@
+import hashlib
+import statistics
+import threading
+import time
+
+from typing import Optional
+
+from .utils import cache_path, read_json, write_json
+
+
+DEFAULT_POLL_SCHEDULE_PATH = cache_path('poll_schedule.json')
+DEFAULT_MIN_POLL_INTERVAL = 15 * 60
+DEFAULT_MAX_POLL_INTERVAL = 24 * 60 * 60
+# Images are polled this many times within their expected time between releases
+POLLS_PER_RELEASE = 4
+# Interval of images which have not released anything since they were last polled grows by this factor
+POLL_BACKOFF_FACTOR = 1.5
+MAX_RELEASES_KEPT = 10
+
+
+def tags_digest(tags: list) -> str:
+    return hashlib.sha256('\n'.join(sorted(tags)).encode()).hexdigest()
+
+
+class PollSchedule:
+    # Schedule of tag lookups per image repository. Every image keeps the times new tags were observed for it,
+    # the median time between them is its release cadence which decides how often it is polled. Images which
+    # have not released for a while are polled less and less often, up to `max_interval`.
+
+    def __init__(
+        self, path: Optional[str] = None, min_interval: int = DEFAULT_MIN_POLL_INTERVAL,
+        max_interval: int = DEFAULT_MAX_POLL_INTERVAL,
+    ):
+        self.path = path
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.lock = threading.Lock()
+        self.entries = self.load()
+
+    def load(self) -> dict:
+        return read_json(self.path, {})
+
+    def clamp(self, interval: float) -> float:
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def cadence_interval(self, releases: list) -> Optional[float]:
+        if len(releases) < 2:
+            return None
+        return self.clamp(statistics.median(b - a for a, b in zip(releases, releases[1:])) / POLLS_PER_RELEASE)
+
+    def track(self, keys) -> None:
+        # Images which are not used by any item anymore are dropped and new images are polled right away
+        with self.lock:
+            self.entries = {key: self.entries.get(key) or {'next_poll_at': 0} for key in keys}
+
+    def due(self, now: Optional[float] = None) -> list:
+        now = now or time.time()
+        with self.lock:
+            return sorted(k for k, v in self.entries.items() if v['next_poll_at'] <= now)
+
+    def next_poll_at(self) -> Optional[float]:
+        with self.lock:
+            return min((v['next_poll_at'] for v in self.entries.values()), default=None)
+
+    def observe(self, key: str, tags: list, now: Optional[float] = None) -> bool:
+        # Returns whether the tags have changed since the image was last polled
+        now = now or time.time()
+        digest = tags_digest(tags)
+        with self.lock:
+            entry = self.entries.setdefault(key, {})
+            changed = entry.get('digest') != digest
+            releases = entry.get('releases') or []
+            if changed:
+                # First observation of an image is not a release, we do not know when its tags were published
+                if entry.get('digest'):
+                    releases = (releases + [now])[-MAX_RELEASES_KEPT:]
+                interval = self.cadence_interval(releases) or self.min_interval
+            else:
+                interval = self.clamp(entry.get('interval', self.min_interval) * POLL_BACKOFF_FACTOR)
+                cadence_interval = self.cadence_interval(releases)
+                if cadence_interval:
+                    interval = min(interval, cadence_interval)
+
+            entry.update({
+                'digest': digest,
+                'releases': releases,
+                'interval': interval,
+                'polled_at': now,
+                'next_poll_at': now + interval,
+            })
+            return changed
+
+    def failed(self, key: str, now: Optional[float] = None) -> None:
+        now = now or time.time()
+        with self.lock:
+            entry = self.entries.setdefault(key, {})
+            entry['next_poll_at'] = now + self.min_interval
+
+    def save(self) -> None:
+        if not self.path:
+            return
+
+        with self.lock:
+            write_json(self.path, self.entries)
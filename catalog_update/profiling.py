@@ -0,0 +1,94 @@
+import contextlib
+import os
+import threading
+import time
+
+from typing import Optional
+
+from .utils import write_json
+
+
+class Profiler:
+
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, **args):
+        # Details only known once the span is done (i.e tag count, exit code) can be added to the yielded dict
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args['error'] = repr(e)
+            raise
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                self.events.append({
+                    'name': name,
+                    'cat': category,
+                    'ph': 'X',
+                    'ts': start * 1e6,
+                    'dur': (end - start) * 1e6,
+                    'pid': self.pid,
+                    'tid': threading.get_ident(),
+                    'args': args,
+                })
+
+    def write(self, path: str) -> None:
+        # Chrome trace event format which can be loaded in chrome://tracing or https://ui.perfetto.dev
+        with self.lock:
+            events = list(self.events)
+        write_json(path, {'traceEvents': events, 'displayTimeUnit': 'ms'})
+
+    def aggregate(self) -> list:
+        phases = {}
+        with self.lock:
+            for event in self.events:
+                phase = phases.setdefault(event['name'], {'name': event['name'], 'count': 0, 'total': 0, 'max': 0})
+                phase['count'] += 1
+                phase['total'] += event['dur'] / 1e6
+                phase['max'] = max(phase['max'], event['dur'] / 1e6)
+
+        return sorted(phases.values(), key=lambda p: p['total'], reverse=True)
+
+    def slowest(self, count: int) -> list:
+        with self.lock:
+            return sorted(self.events, key=lambda e: e['dur'], reverse=True)[:count]
+
+    def report(self, count: int = 10) -> str:
+        lines = [f'{"phase":<24}{"count":>8}{"total (s)":>12}{"mean (s)":>12}{"max (s)":>12}']
+        for phase in self.aggregate():
+            lines.append(
+                f'{phase["name"]:<24}{phase["count"]:>8}{phase["total"]:>12.3f}'
+                f'{phase["total"] / phase["count"]:>12.3f}{phase["max"]:>12.3f}'
+            )
+
+        lines.extend(['', f'{"slowest span":<24}{"duration (s)":>14}  details'])
+        for event in self.slowest(count):
+            details = ', '.join(f'{k}={v}' for k, v in event['args'].items())
+            lines.append(f'{event["name"]:<24}{event["dur"] / 1e6:>14.3f}  {details}')
+
+        return '\n'.join(lines)
+
+
+PROFILER = None
+
+
+def get_profiler() -> Optional[Profiler]:
+    return PROFILER
+
+
+def setup_profiler() -> Profiler:
+    global PROFILER
+    PROFILER = Profiler()
+    return PROFILER
+
+
+def span(name: str, category: str, **args):
+    if PROFILER is None:
+        return contextlib.nullcontext(args)
+    return PROFILER.span(name, category, **args)
@@ -0,0 +1,257 @@
+import asyncio
+import itertools
+import re
+import threading
+import time
+
+from typing import Optional, TYPE_CHECKING
+from yarl import URL
+
+from .exceptions import RegistryError, RegistryRateLimited
+from .registry_scheduler import RETRY_STATUSES, RegistryScheduler, rate_limit_delay
+from .tag_filter import TAGS_CHUNK_SIZE, TagCollector, TagFilter, TagStream
+
+if TYPE_CHECKING:
+    import aiohttp
+
+
+# Docker hub is referred to as docker.io in image names but its registry API is served from a different host
+REGISTRY_HOSTS = {'docker.io': 'registry-1.docker.io'}
+BEARER_PARAMS_RE = re.compile(r'(\w+)="([^"]*)"')
+DEFAULT_TOKEN_TTL = 60
+
+
+class RegistryClient:
+    # Asynchronous client for the Docker Registry HTTP API v2. All requests run on an event loop in a dedicated
+    # thread so that synchronous callers from any thread share the same pooled connections (one session per
+    # registry) and anonymous bearer tokens (per scope). Every lookup goes through the scheduler which limits
+    # concurrency/rate of requests per registry and retries throttled or failed requests.
+
+    def __init__(
+        self, timeout: int = 30, insecure_registries: Optional[list] = None, page_size: Optional[int] = None,
+        scheduler: Optional[RegistryScheduler] = None,
+    ):
+        self.timeout = timeout
+        self.insecure_registries = set(insecure_registries or [])
+        self.page_size = page_size
+        self.scheduler = scheduler or RegistryScheduler()
+        self.sessions = {}
+        self.tokens = {}
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+
+    def registry_url(self, registry: str) -> URL:
+        scheme = 'http' if registry in self.insecure_registries else 'https'
+        return URL(f'{scheme}://{REGISTRY_HOSTS.get(registry, registry)}')
+
+    def run(self, coro):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name='registry-client', daemon=True)
+                self.thread.start()
+
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def get_image_tags(
+        self, registry: str, image: str, known_tags: Optional[list] = None, tag_filter: Optional[TagFilter] = None,
+        timeout: Optional[float] = None,
+    ) -> dict:
+        if not timeout:
+            return self.run(self.list_tags(registry, image, known_tags, tag_filter))
+
+        # Lookup is cancelled once the timeout expires, including any retries it is waiting on
+        try:
+            return self.run(asyncio.wait_for(self.list_tags(registry, image, known_tags, tag_filter), timeout))
+        except asyncio.TimeoutError:
+            raise RegistryError(registry, image, f'Lookup did not finish within {timeout} seconds')
+
+    def close(self) -> None:
+        with self.lock:
+            if self.loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self.close_sessions(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.loop = self.thread = None
+
+    async def close_sessions(self) -> None:
+        sessions, self.sessions = self.sessions, {}
+        self.scheduler.reset()
+        for session in sessions.values():
+            await session.close()
+
+    def session(self, registry: str) -> 'aiohttp.ClientSession':
+        # aiohttp is only imported once we talk to a registry as importing it noticeably slows down start up
+        import aiohttp
+
+        if registry not in self.sessions:
+            self.sessions[registry] = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.sessions[registry]
+
+    async def list_tags(
+        self, registry: str, image: str, known_tags: Optional[list] = None, tag_filter: Optional[TagFilter] = None,
+    ) -> dict:
+        async with self.scheduler.limiter(registry).slot(self.scheduler.priority(registry, image)):
+            return await self.list_image_tags(registry, image, known_tags, tag_filter)
+
+    async def list_image_tags(
+        self, registry: str, image: str, known_tags: Optional[list] = None, tag_filter: Optional[TagFilter] = None,
+    ) -> dict:
+        if known_tags:
+            try:
+                tags = await self.list_new_tags(registry, image, known_tags, tag_filter)
+            except RegistryRateLimited:
+                raise
+            except RegistryError:
+                # Registry might not support the last parameter, let's just try with a complete listing
+                tags = None
+            if tags is not None:
+                return {'Repository': f'{registry}/{image}', 'Tags': tags}
+
+        tags = (await self.list_tags_after(registry, image, tag_filter=tag_filter))[0]
+        return {'Repository': f'{registry}/{image}', 'Tags': tags}
+
+    async def list_new_tags(
+        self, registry: str, image: str, known_tags: list, tag_filter: Optional[TagFilter] = None,
+    ) -> Optional[list]:
+        # Registries return tags in lexical order and the last parameter is the pagination cursor, so asking
+        # for tags after the lexically greatest known tag gives us everything added after it. If known tags
+        # are not lexically ordered or the registry returns tags which are not after the cursor, the registry
+        # does not behave the way we expect and the stored tags are stale/unreliable, so we signal that a complete
+        # listing is required instead. Known tags of a filtered lookup were filtered as well and the greatest of
+        # them is still a valid cursor, tags after it which the filter rejected are just rejected again.
+        cursor = known_tags[-1]
+        if any(a > b for a, b in zip(known_tags, known_tags[1:])):
+            return None
+
+        tags, first_tag = await self.list_tags_after(registry, image, cursor, tag_filter, known_tags)
+        if first_tag is not None and first_tag <= cursor:
+            return None
+
+        return tags
+
+    async def list_tags_after(
+        self, registry: str, image: str, last: Optional[str] = None, tag_filter: Optional[TagFilter] = None,
+        known_tags: Optional[list] = None,
+    ) -> tuple:
+        # Returns the tags kept by the filter along with the first tag the registry listed (filtered or not)
+        params = {'n': str(self.page_size)} if self.page_size else {}
+        if last:
+            params['last'] = last
+        url = self.registry_url(registry).with_path(f'/v2/{image}/tags/list').with_query(params)
+        collector = TagCollector(tag_filter)
+        collector.extend(known_tags or [])
+        first_tag = None
+        while url:
+            page_tags, page_first_tag, url = await self.get_page(registry, image, url, tag_filter)
+            collector.extend(page_tags)
+            if first_tag is None:
+                first_tag = page_first_tag
+
+        return collector.result(), first_tag
+
+    async def get_page(self, registry: str, image: str, url: URL, tag_filter: Optional[TagFilter] = None) -> tuple:
+        import aiohttp
+
+        limiter = self.scheduler.limiter(registry)
+        for attempt in itertools.count():
+            await limiter.wait(image)
+            delay = None
+            try:
+                async with await self.get(registry, image, url) as resp:
+                    # Registry might tell us to slow down even when it has served this request
+                    delay = rate_limit_delay(resp.headers)
+                    if delay is not None:
+                        limiter.block(delay)
+                    if resp.status == 200:
+                        # Response is parsed as it is received and only tags kept by the filter are collected, so
+                        # memory use does not depend on how many tags the repository has
+                        stream, collector = TagStream('tags'), TagCollector(tag_filter)
+                        async for chunk in resp.content.iter_chunked(TAGS_CHUNK_SIZE):
+                            collector.extend(stream.feed(chunk))
+                        collector.extend(stream.feed(b'', final=True))
+                        next_url = resp.links.get('next', {}).get('url')
+                        break
+
+                    error = f'{resp.status} {resp.reason}: {await resp.text()}'
+                    retry = resp.status in RETRY_STATUSES
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                error, retry = str(e) or repr(e), True
+            except (aiohttp.ClientError, ValueError) as e:
+                raise RegistryError(registry, image, str(e) or repr(e))
+
+            if not retry or attempt >= self.scheduler.retries:
+                raise RegistryError(registry, image, error)
+
+            backoff = self.scheduler.backoff(attempt, delay)
+            if backoff > self.scheduler.max_wait:
+                raise RegistryRateLimited(registry, image, backoff)
+            await asyncio.sleep(backoff)
+
+        # Link header usually has a relative url which we resolve against the registry we are talking to
+        return (
+            collector.result(), stream.first_tag,
+            self.registry_url(registry).join(URL(next_url.raw_path_qs)) if next_url else None,
+        )
+
+    async def get(self, registry: str, image: str, url: URL) -> 'aiohttp.ClientResponse':
+        session = self.session(registry)
+        scope = f'repository:{image}:pull'
+        resp = await session.get(url, headers=self.auth_headers(registry, scope))
+        if resp.status != 401 or not resp.headers.get('WWW-Authenticate', '').lower().startswith('bearer '):
+            return resp
+
+        challenge = dict(BEARER_PARAMS_RE.findall(resp.headers['WWW-Authenticate']))
+        resp.release()
+        await self.retrieve_token(session, registry, scope, challenge)
+        return await session.get(url, headers=self.auth_headers(registry, scope))
+
+    def auth_headers(self, registry: str, scope: str) -> dict:
+        token = self.tokens.get((registry, scope))
+        if token and token['expires_at'] > time.monotonic():
+            return {'Authorization': f'Bearer {token["token"]}'}
+        return {}
+
+    async def retrieve_token(
+        self, session: 'aiohttp.ClientSession', registry: str, scope: str, challenge: dict
+    ) -> None:
+        if 'realm' not in challenge:
+            raise RegistryError(registry, scope, 'Bearer challenge did not specify a realm')
+
+        params = {'scope': challenge.get('scope', scope)}
+        if challenge.get('service'):
+            params['service'] = challenge['service']
+
+        async with session.get(URL(challenge['realm']).update_query(params)) as resp:
+            if resp.status != 200:
+                raise RegistryError(registry, scope, f'Unable to retrieve anonymous token: {resp.status}')
+            resp_json = await resp.json(content_type=None)
+
+        self.tokens[(registry, scope)] = {
+            'token': resp_json.get('token') or resp_json.get('access_token'),
+            'expires_at': time.monotonic() + int(resp_json.get('expires_in') or DEFAULT_TOKEN_TTL),
+        }
+
+
+REGISTRY_CLIENT = None
+REGISTRY_CLIENT_LOCK = threading.Lock()
+
+
+def get_registry_client() -> RegistryClient:
+    global REGISTRY_CLIENT
+    with REGISTRY_CLIENT_LOCK:
+        if REGISTRY_CLIENT is None:
+            REGISTRY_CLIENT = RegistryClient()
+        return REGISTRY_CLIENT
+
+
+def setup_registry_client(*args, **kwargs) -> RegistryClient:
+    global REGISTRY_CLIENT
+    with REGISTRY_CLIENT_LOCK:
+        if REGISTRY_CLIENT is not None:
+            REGISTRY_CLIENT.close()
+        REGISTRY_CLIENT = RegistryClient(*args, **kwargs)
+        return REGISTRY_CLIENT
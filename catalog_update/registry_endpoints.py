@@ -0,0 +1,90 @@
+import threading
+import time
+
+from collections import defaultdict
+from typing import Optional
+
+
+DEFAULT_MIRROR_TIMEOUT = 10
+# Mirrors which failed a lookup are not tried again for this many seconds
+MIRROR_COOLDOWN = 300
+
+
+def parse_registry_rewrite(value: str) -> tuple:
+    # SOURCE=TARGET where both are registry[/path] prefixes of image names
+    source, sep, target = value.partition('=')
+    source, target = source.strip('/'), target.strip('/')
+    if not sep or not source or not target:
+        raise ValueError(f'{value!r} is not a valid registry rewrite, expected SOURCE=TARGET')
+    return source, target
+
+
+def parse_registry_mirror(value: str) -> tuple:
+    # REGISTRY=MIRROR[/PATH], path is prepended to image names i.e for pull-through proxy projects
+    registry, sep, mirror = value.partition('=')
+    mirror = mirror.strip('/')
+    if not sep or not registry or '/' in registry or not mirror:
+        raise ValueError(f'{value!r} is not a valid registry mirror, expected REGISTRY=MIRROR[/PATH]')
+    return registry, mirror
+
+
+def split_name(name: str) -> tuple:
+    registry, _, image = name.partition('/')
+    return registry, image
+
+
+class RegistryEndpoints:
+    # Where tags of images are looked up. Rewrites permanently change the registry/path an image is looked up
+    # from (first matching rule wins), while mirrors of a registry are tried in order before the registry itself
+    # and are skipped for a while once a lookup from them fails or times out.
+
+    def __init__(
+        self, rewrites: Optional[list] = None, mirrors: Optional[list] = None,
+        mirror_timeout: float = DEFAULT_MIRROR_TIMEOUT, cooldown: int = MIRROR_COOLDOWN,
+    ):
+        self.rewrites = list(rewrites or [])
+        self.mirrors = defaultdict(list)
+        for registry, mirror in mirrors or []:
+            self.mirrors[registry].append(mirror)
+        self.mirror_timeout = mirror_timeout
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.failed_at = {}
+
+    def rewrite(self, registry: str, image: str) -> tuple:
+        name = f'{registry}/{image}'
+        for source, target in self.rewrites:
+            if name == source or name.startswith(f'{source}/'):
+                return split_name(target + name[len(source):])
+        return registry, image
+
+    def endpoints(self, registry: str, image: str) -> list:
+        # (mirror, registry, image) of every endpoint to try in order, mirror is None for the registry itself
+        now = time.monotonic()
+        with self.lock:
+            mirrors = [
+                m for m in self.mirrors.get(registry, []) if m not in self.failed_at or
+                now - self.failed_at[m] >= self.cooldown
+            ]
+        return [(m, *split_name(f'{m}/{image}')) for m in mirrors] + [(None, registry, image)]
+
+    def failed(self, mirror: str) -> None:
+        with self.lock:
+            self.failed_at[mirror] = time.monotonic()
+
+    def succeeded(self, mirror: str) -> None:
+        with self.lock:
+            self.failed_at.pop(mirror, None)
+
+
+REGISTRY_ENDPOINTS = RegistryEndpoints()
+
+
+def get_registry_endpoints() -> RegistryEndpoints:
+    return REGISTRY_ENDPOINTS
+
+
+def setup_registry_endpoints(*args, **kwargs) -> RegistryEndpoints:
+    global REGISTRY_ENDPOINTS
+    REGISTRY_ENDPOINTS = RegistryEndpoints(*args, **kwargs)
+    return REGISTRY_ENDPOINTS
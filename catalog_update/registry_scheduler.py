@@ -0,0 +1,196 @@
+import contextlib
+import email.utils
+import heapq
+import itertools
+import random
+import time
+
+from typing import Optional
+
+from .exceptions import RegistryRateLimited
+
+
+DEFAULT_REGISTRY_CONCURRENCY = 8
+DEFAULT_REGISTRY_RETRIES = 4
+DEFAULT_REGISTRY_MAX_WAIT = 60
+# Docker hub throttles anonymous clients aggressively, so it gets more conservative limits unless configured otherwise
+DEFAULT_REGISTRY_LIMITS = {'docker.io': {'concurrency': 4, 'rate': 5.0}}
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30
+
+
+def parse_rate_limit_value(value: Optional[str]) -> Optional[float]:
+    # Docker hub sends values like `76;w=21600` where w is the window in seconds
+    if value is None:
+        return None
+    try:
+        return float(value.split(';', 1)[0].strip())
+    except ValueError:
+        return None
+
+
+def rate_limit_delay(headers) -> Optional[float]:
+    # Number of seconds the registry has asked us to wait before sending another request, if any
+    retry_after = headers.get('Retry-After')
+    if retry_after:
+        seconds = parse_rate_limit_value(retry_after)
+        if seconds is None:
+            try:
+                seconds = email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                seconds = None
+        if seconds is not None:
+            return max(seconds, 0)
+
+    remaining = parse_rate_limit_value(headers.get('RateLimit-Remaining') or headers.get('X-RateLimit-Remaining'))
+    if remaining is None or remaining > 0:
+        return None
+
+    reset = parse_rate_limit_value(headers.get('RateLimit-Reset') or headers.get('X-RateLimit-Reset'))
+    if reset is None:
+        # Quota is exhausted and we have not been told when it resets, so we assume the complete window
+        window = (headers.get('RateLimit-Remaining') or headers.get('X-RateLimit-Remaining') or '').partition(';w=')[2]
+        return parse_rate_limit_value(window) or BACKOFF_CAP
+
+    # Some registries send the reset time as an epoch timestamp instead of a number of seconds
+    return max(reset - time.time(), 0) if reset > time.time() / 2 else reset
+
+
+class RegistryLimiter:
+    # Limits requests sent to a single registry. Lookups hold one of `concurrency` slots while they run and every
+    # request takes a token from a bucket refilled at `rate` tokens per second. Lookups waiting for a slot are
+    # served by priority, so images shared by many item(s) are retrieved first. This is only used from the event
+    # loop of the registry client, so no locking is required.
+
+    def __init__(
+        self, registry: str, concurrency: int, rate: Optional[float] = None, max_wait: int = DEFAULT_REGISTRY_MAX_WAIT
+    ):
+        self.registry = registry
+        self.concurrency = concurrency
+        self.rate = rate
+        self.max_wait = max_wait
+        self.capacity = max(concurrency, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.active = 0
+        self.waiters = []
+        self.counter = itertools.count()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: int = 0):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: int) -> None:
+        import asyncio
+
+        if self.active < self.concurrency and not self.waiters:
+            self.active += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (-priority, next(self.counter), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Slot might have been handed over to us right before we were cancelled
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self.waiters:
+            waiter = heapq.heappop(self.waiters)[2]
+            if not waiter.done():
+                # Slot is handed over as is, so active count remains the same
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def blocked_for(self) -> float:
+        return max(self.blocked_until - time.monotonic(), 0)
+
+    async def wait(self, image: str) -> None:
+        import asyncio
+
+        while True:
+            blocked_for = self.blocked_for()
+            if blocked_for > self.max_wait:
+                raise RegistryRateLimited(self.registry, image, blocked_for)
+            if blocked_for:
+                await asyncio.sleep(blocked_for)
+                continue
+
+            if not self.rate:
+                return
+
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RegistryScheduler:
+
+    def __init__(
+        self, concurrency: int = DEFAULT_REGISTRY_CONCURRENCY, rate: Optional[float] = None,
+        limits: Optional[dict] = None, retries: int = DEFAULT_REGISTRY_RETRIES,
+        max_wait: int = DEFAULT_REGISTRY_MAX_WAIT,
+    ):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.limits = {**DEFAULT_REGISTRY_LIMITS, **(limits or {})}
+        self.retries = retries
+        self.max_wait = max_wait
+        self.limiters = {}
+        # Number of item(s) using an image keyed by (registry, image)
+        self.priorities = {}
+
+    def limiter(self, registry: str) -> RegistryLimiter:
+        if registry not in self.limiters:
+            limits = self.limits.get(registry) or {}
+            self.limiters[registry] = RegistryLimiter(
+                registry, limits.get('concurrency') or self.concurrency, limits.get('rate', self.rate), self.max_wait,
+            )
+        return self.limiters[registry]
+
+    def priority(self, registry: str, image: str) -> int:
+        return self.priorities.get((registry, image), 0)
+
+    def set_priorities(self, priorities: dict) -> None:
+        self.priorities = dict(priorities)
+
+    def reset(self) -> None:
+        # Limiters hold futures bound to the event loop they were used with
+        self.limiters = {}
+
+    def backoff(self, attempt: int, delay: Optional[float] = None) -> float:
+        # Full jitter so that lookups which failed together do not retry together
+        return max(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)), delay or 0)
+
+
+def parse_registry_limit(value: str) -> tuple:
+    # REGISTRY=CONCURRENCY[:RATE]
+    registry, sep, limits = value.partition('=')
+    concurrency, _, rate = limits.partition(':')
+    if not sep or not registry or not concurrency.isdigit() or int(concurrency) < 1:
+        raise ValueError(f'{value!r} is not a valid registry limit, expected REGISTRY=CONCURRENCY[:RATE]')
+
+    try:
+        rate = float(rate) if rate else None
+    except ValueError:
+        raise ValueError(f'{rate!r} is not a valid request rate for {registry!r}')
+
+    return registry, {'concurrency': int(concurrency), 'rate': rate}
@@ -0,0 +1,30 @@
+import functools
+
+
+class SchemaValidationError(Exception):
+    pass
+
+
+class SchemaValidator:
+    # Schemas are checked and their validator is built once on first use instead of on every validation as
+    # jsonschema.validate does. jsonschema itself is only imported then as it noticeably slows down start up.
+
+    def __init__(self, schema: dict):
+        self.schema = schema
+
+    @functools.cached_property
+    def validator(self):
+        from jsonschema.validators import validator_for
+
+        cls = validator_for(self.schema)
+        cls.check_schema(self.schema)
+        return cls(self.schema)
+
+    def validate(self, instance) -> None:
+        if self.validator.is_valid(instance):
+            return
+
+        from jsonschema.exceptions import best_match
+
+        # best_match is what jsonschema.validate reports as well, so error messages remain the same
+        raise SchemaValidationError(str(best_match(self.validator.iter_errors(instance))))
@@ -1,27 +1,108 @@
 #!/usr/bin/env python
 import argparse
+import collections
+import contextlib
 import functools
+import itertools
 import os
+import shutil
+import signal
+import subprocess
+import tempfile
 import textwrap
+import threading
+import time
 
-from catalog_update.exceptions import TrainNotFound
+from concurrent.futures import ThreadPoolExecutor
+from catalog_update.catalog_index import default_catalog_index_path, get_catalog_index, setup_catalog_index
+from catalog_update.docker_utils import (
+    TAGS_BACKEND, TAGS_BACKENDS, get_tags_backend, retrieve_image_tags, setup_tags_backend,
+)
+from catalog_update.exceptions import RegistryError, TrainNotFound, ValidationException
 from catalog_update.git_utils import (
-    create_pull_request, checkout_branch, checkout_and_update_branch, commit_changes, generate_branch_name, push_changes
+    PR_BACKEND, PR_BACKENDS, add_worktree, create_pull_request, checkout_branch, checkout_and_update_branch,
+    commit_changes, generate_app_branch_name, generate_branch_name, pull_request_exists, push_changes, remove_worktree,
+    setup_pr_backend,
+)
+from catalog_update.github import close_github_client
+from catalog_update.manifest import catalog_repo_path, load_manifest, validate_catalogs
+from catalog_update.poll_schedule import (
+    DEFAULT_MAX_POLL_INTERVAL, DEFAULT_MIN_POLL_INTERVAL, DEFAULT_POLL_SCHEDULE_PATH, PollSchedule,
+)
+from catalog_update.profiling import setup_profiler
+from catalog_update.plan import (
+    apply_plan, apply_plan_item, generate_plan, load_plan, merge_plans, schedule_plan_in_train, write_plan,
+)
+from catalog_update.registry_endpoints import (
+    DEFAULT_MIRROR_TIMEOUT, parse_registry_mirror, parse_registry_rewrite, setup_registry_endpoints,
+)
+from catalog_update.registry_scheduler import (
+    DEFAULT_REGISTRY_CONCURRENCY, DEFAULT_REGISTRY_MAX_WAIT, DEFAULT_REGISTRY_RETRIES, RegistryScheduler,
+    parse_registry_limit,
+)
+from catalog_update.schema import SchemaValidationError, SchemaValidator
+from catalog_update.selection import get_item_selection, parse_shard, setup_item_selection
+from catalog_update.strategy_cache import (
+    DEFAULT_STRATEGY_CACHE_MAX_ENTRIES, DEFAULT_STRATEGY_CACHE_PATH, setup_strategy_cache,
+)
+from catalog_update.tag_cache import (
+    DEFAULT_FULL_REFRESH_INTERVAL, DEFAULT_TAG_CACHE_PATH, DEFAULT_TAG_CACHE_TTL, get_tag_cache, setup_tag_cache,
+)
+from catalog_update.tag_snapshot import get_tag_snapshot, setup_tag_snapshot, write_tag_snapshot
+from catalog_update.validation_cache import (
+    DEFAULT_VALIDATION_CACHE_MAX_ENTRIES, DEFAULT_VALIDATION_CACHE_PATH, setup_validation_cache,
+)
+from catalog_update.time_budget import (
+    DEFAULT_RUN_PROGRESS_PATH, DEFAULT_TIME_BUDGET_RESERVE, RunProgress, get_time_budget, setup_time_budget,
+)
+from catalog_update.update import (
+    image_items, plan_item, schedule_items_in_order, schedule_items_in_train, summarize_items, update_item,
 )
-from catalog_update.update import update_items_in_train
 from dotenv import dotenv_values
-from jsonschema import validate as json_schema_validate, ValidationError as JsonValidationError
+from typing import Optional
 
 
-def update_items(catalog_path: str, train_name: str) -> dict:
-    print(f'[\033[92mOK\x1B[0m]\tLooking to update catalog item(s) in {train_name!r} train')
+# Adding/removing worktrees updates shared repository metadata, so it is not done concurrently
+WORKTREES_LOCK = threading.Lock()
+SERVE_RETRY_INTERVAL = 60
+# Settings of catalog repositories specified in a manifest which override the configuration i.e base branch/reviewers
+REPO_SETTINGS = {}
+# Item(s) using every image per catalog, lookups of images used the most across catalogs are sent first and time boxed
+# runs value item(s) sharing images higher
+IMAGE_USAGE = {}
+CONFIG_VALIDATOR = SchemaValidator({
+    'type': 'object',
+    'properties': {
+        'GITHUB_TOKEN': {'type': 'string'},
+        'GITHUB_BASE': {'type': 'string'},
+        'GITHUB_USERNAME': {'type': 'string'},
+        'GITHUB_EMAIL': {'type': 'string'},
+        'GITHUB_REVIEWER': {'type': 'array'},
+    },
+    'required': ['GITHUB_TOKEN', 'GITHUB_EMAIL', 'GITHUB_USERNAME'],
+})
+
+
+def schedule_items(
+    catalog_path: str, train_name: str, executor: ThreadPoolExecutor, tags_executor: ThreadPoolExecutor,
+    schedule=schedule_items_in_train,
+):
     train_path = os.path.join(catalog_path, train_name)
     try:
-        summary = update_items_in_train(train_path)
+        return schedule(train_path, executor, tags_executor)
     except TrainNotFound:
         print(f'[\033[91mFAILED\x1B[0m]\tSpecified {train_path!r} path does not exist')
         exit(1)
 
+
+def update_items(train_name: str, scheduled_items) -> dict:
+    print(f'[\033[92mOK\x1B[0m]\tLooking to update catalog item(s) in {train_name!r} train')
+    summary = summarize_items(scheduled_items)
+    print_upgraded_items(summary)
+    return summary
+
+
+def print_upgraded_items(summary: dict) -> None:
     if summary['upgraded']:
         print('[\033[92mOK\x1B[0m]\tFollowing item(s) were upgraded successfully:')
         upgraded = summary['upgraded']
@@ -29,7 +110,6 @@ def update_items(catalog_path: str, train_name: str) -> dict:
             print(f'[\033[92mOK\x1B[0m]\t{index + 1}) {item} (new version is {upgraded[item]["new_version"]})')
     else:
         print('[\033[91mFAILED\x1B[0m]\tNo item(s) were upgraded')
-    return summary
 
 
 @functools.cache
@@ -45,33 +125,39 @@ def get_config() -> dict:
     return config
 
 
+def get_repo_config(repo_path: str) -> dict:
+    return {**get_config(), **REPO_SETTINGS.get(os.path.normpath(os.path.abspath(repo_path)), {})}
+
+
+def setup_repo_settings(catalogs: list) -> None:
+    for catalog in catalogs:
+        settings = {}
+        if catalog.get('base_branch'):
+            settings['GITHUB_BASE'] = catalog['base_branch']
+        if 'reviewers' in catalog:
+            settings['GITHUB_REVIEWER'] = catalog['reviewers']
+        REPO_SETTINGS[os.path.normpath(os.path.abspath(catalog_repo_path(catalog['path'])))] = settings
+
+
 def validate_config() -> None:
     try:
-        json_schema_validate({
-            'type': 'object',
-            'properties': {
-                'GITHUB_TOKEN': {'type': 'string'},
-                'GITHUB_BASE': {'type': 'string'},
-                'GITHUB_USERNAME': {'type': 'string'},
-                'GITHUB_EMAIL': {'type': 'string'},
-                'GITHUB_REVIEWER': {'type': 'array'},
-            },
-            'required': ['GITHUB_TOKEN', 'GITHUB_EMAIL', 'GITHUB_USERNAME'],
-        }, get_config())
-    except JsonValidationError as e:
+        CONFIG_VALIDATOR.validate(get_config())
+    except SchemaValidationError as e:
         print(f'[\033[91mFAILED\x1B[0m]\tInvalid configuration specified for pushing changes: {e}')
         exit(1)
 
 
-def push_changes_upstream(catalog_path: str, upgraded_apps: list, branch: str) -> None:
+def push_changes_upstream(
+    catalog_path: str, upgraded_apps: list, branch: str, changed_files: Optional[list] = None
+) -> None:
     print('[\033[92mOK\x1B[0m]\tPushing changed items upstream')
     try:
-        config = get_config()
+        config = get_repo_config(catalog_path)
         message = textwrap.dedent(f'''Upgraded catalog item(s)
 
         This commit upgrades {", ".join(upgraded_apps)} catalog item(s).
         ''')
-        commit_changes(catalog_path, message, config['GITHUB_USERNAME'], config['GITHUB_EMAIL'])
+        commit_changes(catalog_path, message, config['GITHUB_USERNAME'], config['GITHUB_EMAIL'], changed_files)
         push_changes(catalog_path, config['GITHUB_TOKEN'], branch, config.get('GITHUB_ORIGIN'))
         print('[\033[92mOK\x1B[0m]\tCreating a PR')
         create_pull_request(
@@ -86,31 +172,720 @@ def push_changes_upstream(catalog_path: str, upgraded_apps: list, branch: str) -
         print('[\033[92mOK\x1B[0m]\tSuccessfully created PR')
 
 
-def checkout_update_repo(path: str, branch: str) -> None:
+def checkout_update_repo(path: str, branch: Optional[str] = None) -> None:
+    # If no branch is specified, we only checkout and update the base branch
+    config = get_repo_config(path)
+    branch = branch or config['GITHUB_BASE']
     print(f'[\033[92mOK\x1B[0m]\tChecking out {branch!r}')
     try:
-        checkout_and_update_branch(path, get_config()['GITHUB_BASE'])
-        checkout_branch(path, branch, True)
+        checkout_and_update_branch(
+            path, config['GITHUB_BASE'], int(config.get('GIT_FETCH_DEPTH') or 0) or None,
+            config.get('GIT_FETCH_FILTER') or None,
+        )
+        if branch != config['GITHUB_BASE']:
+            checkout_branch(path, branch, True)
     except Exception as e:
         print(f'[\033[91mFAILED\x1B[0m]\tFailed to checkout {branch!r} branch: {e}')
         exit(1)
 
 
-def update_trains(catalog_path: str, push: bool) -> None:
+def get_trains(catalog_path: str) -> list:
+    index = get_catalog_index(catalog_path)
+    if index:
+        # Catalog is refreshed here as this is where we start looking at it after it has been checked out
+        index.refresh()
+        trains = index.train_names()
+    else:
+        trains = sorted(filter(lambda path: os.path.isdir(os.path.join(catalog_path, path)), os.listdir(catalog_path)))
+
+    selection = get_item_selection()
+    missing = sorted(set(selection.trains) - set(trains))
+    if missing:
+        print(f'[\033[91mFAILED\x1B[0m]\tSpecified {", ".join(missing)} train(s) do not exist')
+        exit(1)
+
+    trains = list(filter(selection.train_selected, trains))
+    if selection.shard:
+        print(f'[\033[92mOK\x1B[0m]\tProcessing shard {selection.shard[0]}/{selection.shard[1]} of catalog item(s)')
+
+    registry_lookups = get_tags_backend() == 'registry' and not get_tag_snapshot()
+    if registry_lookups or get_time_budget():
+        # Images recorded with upgrade decisions are used where available so that values files are not parsed here
+        IMAGE_USAGE[os.path.abspath(catalog_path)] = image_items(
+            (os.path.join(catalog_path, train) for train in trains), cached=True
+        )
+
+    if registry_lookups:
+        from catalog_update.registry import get_registry_client
+
+        # Lookups of images shared by many item(s) are sent first when registries are busy, as they unblock the most
+        get_registry_client().scheduler.set_priorities(sum(
+            (collections.Counter({k: len(v) for k, v in images.items()}) for images in IMAGE_USAGE.values()),
+            collections.Counter(),
+        ))
+    return trains
+
+
+@contextlib.contextmanager
+def executors(jobs: int):
+    # Image tag lookups get their own pool as they are submitted from within item(s) being upgraded and
+    # sharing the same bounded pool could otherwise starve/deadlock item(s) waiting on their lookups
+    with ThreadPoolExecutor(max_workers=jobs) as executor, ThreadPoolExecutor(max_workers=jobs) as tags_executor:
+        yield executor, tags_executor
+
+
+def update_catalogs(catalog_paths: list, push: bool, jobs: int = 1, per_app: bool = False) -> None:
+    # Catalogs share the worker pools along with image tag lookups and caches, while every catalog still gets its
+    # own branch, commit and PR. Helpers exit on failures to push a catalog, the remaining catalogs are still
+    # pushed and we only exit once all of them have been processed.
+    failed = []
+    with executors(jobs) as pools:
+        if per_app:
+            for catalog_path in catalog_paths:
+                print_catalog(catalog_path, catalog_paths)
+                try:
+                    update_trains_per_app(catalog_path, push, jobs, pools)
+                except SystemExit:
+                    failed.append(catalog_path)
+        else:
+            # All catalogs are checked out and their trains scheduled upfront so that item(s) across catalogs are
+            # upgraded concurrently
+            scheduled = []
+            for catalog_path in catalog_paths:
+                print_catalog(catalog_path, catalog_paths)
+                scheduled.append((catalog_path, *schedule_catalog_update(catalog_path, pools)))
+
+            for catalog_path, repo_path, branch_name, scheduled_trains in scheduled:
+                print_catalog(catalog_path, catalog_paths)
+                upgraded_apps, changed_files = [], []
+                for train, scheduled_items in scheduled_trains:
+                    upgraded = update_items(train, scheduled_items)['upgraded']
+                    upgraded_apps.extend(upgraded.keys())
+                    changed_files.extend(
+                        itertools.chain.from_iterable(i['changed_files'] for i in upgraded.values())
+                    )
+
+                try:
+                    push_upgraded_items(repo_path, upgraded_apps, branch_name, push, changed_files)
+                except SystemExit:
+                    failed.append(catalog_path)
+
+    if failed:
+        print(f'[\033[91mFAILED\x1B[0m]\tFailed to push upgrade(s) of {", ".join(map(repr, failed))} catalog(s)')
+        exit(1)
+
+
+def print_catalog(catalog_path: str, catalog_paths: list) -> None:
+    if len(catalog_paths) > 1:
+        print(f'[\033[92mOK\x1B[0m]\tProcessing {catalog_path!r} catalog')
+
+
+def schedule_catalog_update(catalog_path: str, pools: tuple) -> tuple:
     branch_name = generate_branch_name()
-    repo_path = catalog_path.replace('/library/ix-dev', '')
+    repo_path = catalog_repo_path(catalog_path)
     checkout_update_repo(repo_path, branch_name)
-    upgraded_apps = []
-    for train in filter(lambda path: os.path.isdir(os.path.join(catalog_path, path)), os.listdir(catalog_path)):
-        upgraded_apps.extend(update_items(catalog_path, train)['upgraded'].keys())
+    return repo_path, branch_name, schedule_catalog(catalog_path, pools)
 
+
+def schedule_catalog(
+    catalog_path: str, pools: tuple, schedule=schedule_items_in_train, item_func=update_item
+) -> list:
+    trains = get_trains(catalog_path)
+    budget = get_time_budget()
+    if not budget:
+        # All trains are scheduled upfront so that item(s) across trains are upgraded concurrently
+        return [(train, schedule_items(catalog_path, train, *pools, schedule)) for train in trains]
+
+    # Time boxed runs start item(s) of all trains in order of their value and defer them once the budget runs out
+    order = functools.partial(budget.order, images=IMAGE_USAGE.get(os.path.abspath(catalog_path), {}))
+    return [
+        (os.path.basename(train_path), scheduled_items) for train_path, scheduled_items in schedule_items_in_order(
+            [os.path.join(catalog_path, train) for train in trains], *pools, budget.budgeted(item_func), order,
+        )
+    ]
+
+
+def push_upgraded_items(
+    repo_path: str, upgraded_apps: list, branch_name: str, push: bool, changed_files: Optional[list] = None
+) -> None:
     if push and upgraded_apps:
         validate_config()
-        push_changes_upstream(repo_path, upgraded_apps, branch_name)
+        push_changes_upstream(repo_path, upgraded_apps, branch_name, changed_files)
     else:
         print('[\033[91mNo Items upgraded\x1B[0m]')
 
 
+def update_trains_per_app(catalog_path: str, push: bool, jobs: int, pools: tuple) -> None:
+    repo_path = catalog_repo_path(catalog_path)
+    checkout_update_repo(repo_path)
+    print('[\033[92mOK\x1B[0m]\tLooking for upgrades of catalog item(s)')
+    plan = generate_plan(catalog_path, schedule_catalog(catalog_path, pools, schedule_plan_in_train, plan_item))
+
+    push_plan_per_app(repo_path, catalog_path, plan, push, jobs)
+
+
+def push_plan_per_app(repo_path: str, catalog_path: str, plan: dict, push: bool, jobs: int = 1) -> None:
+    entries = [e for e in plan['items'].values() if not e['error']]
+    if not entries:
+        print('[\033[91mNo Items upgraded\x1B[0m]')
+        return
+
+    if push:
+        validate_config()
+
+    # Every app is prepared in its own worktree, so apps are committed and pushed concurrently
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        errors = list(executor.map(
+            functools.partial(prepare_app_change, repo_path, catalog_path, push=push), entries
+        ))
+
+    for entry, error in zip(entries, errors):
+        app = f'{entry["train"]}/{entry["item"]}'
+        if error:
+            print(f'[\033[91mFAILED\x1B[0m]\tFailed to upgrade {app}: {error}')
+        else:
+            print(f'[\033[92mOK\x1B[0m]\tUpgraded {app} (new version is {entry["new_version"]})')
+
+    if any(errors):
+        exit(1)
+
+
+def prepare_app_change(repo_path: str, catalog_path: str, entry: dict, push: bool) -> Optional[str]:
+    config = get_repo_config(repo_path)
+    branch = generate_app_branch_name(entry['train'], entry['item'])
+    worktree_path = tempfile.mkdtemp(prefix=f'{branch}-')
+    try:
+        with WORKTREES_LOCK:
+            add_worktree(repo_path, worktree_path, f'origin/{config["GITHUB_BASE"]}')
+
+        # If the app already has a branch (i.e an open PR from an earlier run), it is reset and reused so that
+        # the existing PR gets updated instead of a duplicate being created
+        checkout_branch(worktree_path, branch, create=True, reset=True)
+        info = apply_plan_item(os.path.join(worktree_path, os.path.relpath(catalog_path, repo_path)), entry)
+        if not info['upgraded']:
+            return info['error']
+
+        message = textwrap.dedent(f'''Upgrade {entry["item"]} catalog item
+
+        This commit upgrades {entry["item"]} catalog item to {entry["new_version"]}.
+        ''')
+        commit_changes(
+            worktree_path, message, config['GITHUB_USERNAME'], config['GITHUB_EMAIL'], info['changed_files']
+        )
+        if push:
+            push_changes(worktree_path, config['GITHUB_TOKEN'], branch, config.get('GITHUB_ORIGIN'), force=True)
+            gh_config = {k: v for k, v in config.items() if k != 'GITHUB_REVIEWER'}
+            if not pull_request_exists(worktree_path, branch, gh_config):
+                create_pull_request(worktree_path, config['GITHUB_BASE'], branch, config['GITHUB_REVIEWER'], gh_config)
+    except Exception as e:
+        return str(e)
+    finally:
+        with WORKTREES_LOCK:
+            try:
+                remove_worktree(repo_path, worktree_path)
+            except Exception:
+                shutil.rmtree(worktree_path, ignore_errors=True)
+
+
+def plan_trains(catalog_path: str, plan_path: str, jobs: int = 1) -> None:
+    with executors(jobs) as (executor, tags_executor):
+        scheduled = [
+            (train, schedule_items(catalog_path, train, executor, tags_executor, schedule_plan_in_train))
+            for train in get_trains(catalog_path)
+        ]
+        plan = generate_plan(catalog_path, scheduled)
+
+    upgrades = [k for k, v in plan['items'].items() if not v['error']]
+    if upgrades:
+        print('[\033[92mOK\x1B[0m]\tUpgrades are available for following item(s):')
+        for index, item in enumerate(upgrades):
+            new_version = plan['items'][item]['new_version']
+            print(f'[\033[92mOK\x1B[0m]\t{index + 1}) {item} (new version will be {new_version})')
+    else:
+        print('[\033[91mFAILED\x1B[0m]\tNo upgrades are available')
+
+    write_plan(plan_path, plan)
+    print(f'[\033[92mOK\x1B[0m]\tPlan written to {plan_path!r}')
+
+
+def fetch_tags(catalog_path: str, out_path: str, jobs: int = 1) -> None:
+    # Every image is looked up once no matter how many item(s) use it, complete tag lists are stored and tag
+    # filters of item(s) are applied when the snapshot is used
+    images = sorted(image_items(os.path.join(catalog_path, train) for train in get_trains(catalog_path)))
+    print(f'[\033[92mOK\x1B[0m]\tRetrieving tags of {len(images)} image(s)')
+    tag_cache = get_tag_cache()
+
+    def lookup(key: tuple) -> tuple:
+        try:
+            return tag_cache.get(*key, retrieve_image_tags)['Tags'], None
+        except (subprocess.CalledProcessError, RegistryError) as e:
+            return None, str(e)
+
+    images_tags, failed = {}, {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for (registry, image), (tags, error) in zip(images, executor.map(lookup, images)):
+            if error:
+                print(f'[\033[91mFAILED\x1B[0m]\tFailed to retrieve available image tags: {error}')
+                failed[f'{registry}/{image}'] = error
+            else:
+                images_tags[(registry, image)] = tags
+
+    write_tag_snapshot(out_path, images_tags, failed)
+    print(f'[\033[92mOK\x1B[0m]\tTags of {len(images_tags)} image(s) written to {out_path!r}')
+
+
+def load_plans(plan_paths: list, merge: bool = False) -> dict:
+    try:
+        plans = [load_plan(plan_path) for plan_path in plan_paths]
+        return merge_plans(plans) if merge or len(plans) > 1 else plans[0]
+    except ValidationException as e:
+        print(f'[\033[91mFAILED\x1B[0m]\t{e}')
+        exit(1)
+
+
+def merge_plan_files(plan_paths: list, out_path: str) -> None:
+    plan = load_plans(plan_paths, merge=True)
+    write_plan(out_path, plan)
+    print(f'[\033[92mOK\x1B[0m]\tMerged {len(plan_paths)} plan(s) with {len(plan["items"])} item(s) to {out_path!r}')
+
+
+def apply_plan_file(
+    catalog_path: Optional[str], plan_paths: list, push: bool, per_app: bool = False, jobs: int = 1
+) -> None:
+    # Plans of multiple shards are merged, so that they are applied in a single commit / PR
+    plan = load_plans(plan_paths)
+
+    catalog_path = catalog_path or plan.get('catalog_path')
+    if not catalog_path:
+        print('[\033[91mFAILED\x1B[0m]\tCatalog path must be specified as plan does not specify it')
+        exit(1)
+
+    if per_app:
+        repo_path = catalog_repo_path(catalog_path)
+        checkout_update_repo(repo_path)
+        return push_plan_per_app(repo_path, catalog_path, plan, push, jobs)
+
+    branch_name = generate_branch_name()
+    repo_path = catalog_repo_path(catalog_path)
+    checkout_update_repo(repo_path, branch_name)
+    upgraded_apps, changed_files = [], []
+    for train, summary in apply_plan(catalog_path, plan).items():
+        print(f'[\033[92mOK\x1B[0m]\tApplying planned upgrade(s) of catalog item(s) in {train!r} train')
+        print_upgraded_items(summary)
+        upgraded_apps.extend(summary['upgraded'].keys())
+        changed_files.extend(itertools.chain.from_iterable(i['changed_files'] for i in summary['upgraded'].values()))
+
+    push_upgraded_items(repo_path, upgraded_apps, branch_name, push, changed_files)
+
+
+def poll_image(schedule: PollSchedule, key: str) -> bool:
+    registry, image = key.split('/', 1)
+    tag_cache = get_tag_cache()
+    # Incremental lookups miss new tags sorting before the greatest known tag, polls would then never see them
+    tag_cache.invalidate(registry, image, complete=True)
+    try:
+        tags = tag_cache.get(registry, image, retrieve_image_tags)['Tags']
+    except (subprocess.CalledProcessError, RegistryError) as e:
+        print(f'[\033[91mFAILED\x1B[0m]\tFailed to retrieve available image tags of {key}: {e}')
+        schedule.failed(key)
+        return False
+    else:
+        return schedule.observe(key, tags)
+
+
+def sync_catalog(repo_path: str, catalog_path: str, schedule: PollSchedule) -> dict:
+    checkout_update_repo(repo_path)
+    images = {
+        f'{registry}/{image}': items for (registry, image), items in image_items(
+            os.path.join(catalog_path, train) for train in get_trains(catalog_path)
+        ).items()
+    }
+    schedule.track(images)
+    return images
+
+
+def upgrade_affected_items(repo_path: str, catalog_path: str, item_paths: list, push: bool, jobs: int) -> None:
+    branch_name = generate_branch_name()
+    checkout_update_repo(repo_path, branch_name)
+    index = get_catalog_index(catalog_path)
+    if index:
+        # Checkout might have brought in changes to item(s) since the catalog was last synced
+        index.refresh()
+    upgraded_apps, changed_files = [], []
+    trains = itertools.groupby(sorted(item_paths), key=lambda p: os.path.basename(os.path.dirname(p)))
+    with executors(jobs) as (executor, tags_executor):
+        for train, train_items in trains:
+            train_items = list(train_items)
+            results = executor.map(functools.partial(update_item, tags_executor=tags_executor), train_items)
+            upgraded = update_items(train, zip(train_items, results))['upgraded']
+            upgraded_apps.extend(upgraded.keys())
+            changed_files.extend(itertools.chain.from_iterable(i['changed_files'] for i in upgraded.values()))
+
+    push_upgraded_items(repo_path, upgraded_apps, branch_name, push, changed_files)
+
+
+def serve(
+    catalog_path: str, push: bool, schedule: PollSchedule, stop: threading.Event, jobs: int = 1,
+    batch_window: int = 600, sync_interval: int = 3600,
+) -> None:
+    # Images are polled according to their own schedule and only item(s) using images which have new tags are
+    # upgraded. Item(s) affected within the batch window are upgraded together in a single commit / PR.
+    repo_path = catalog_repo_path(catalog_path)
+    images, synced_at = {}, 0
+    pending, pending_since = set(), None
+    while not stop.is_set():
+        try:
+            # Helpers used here exit on failures which should not stop the daemon, we just try again later
+            if time.time() - synced_at >= sync_interval:
+                synced_at = 0
+                images, synced_at = sync_catalog(repo_path, catalog_path, schedule), time.time()
+
+            due = schedule.due()
+            if due:
+                with ThreadPoolExecutor(max_workers=jobs) as executor:
+                    polled = executor.map(functools.partial(poll_image, schedule), due)
+                    for key in (k for k, changed in zip(due, polled) if changed):
+                        print(f'[\033[92mOK\x1B[0m]\tNew tags are available for {key}')
+                        pending.update(images.get(key) or [])
+                pending_since = pending_since or (time.time() if pending else None)
+                schedule.save()
+                get_tag_cache().save()
+
+            if pending and time.time() - pending_since >= batch_window:
+                upgrade_affected_items(repo_path, catalog_path, sorted(pending), push, jobs)
+                pending, pending_since = set(), None
+                # Upgrades leave the repository on the upgrade branch, so we go back to the base branch
+                synced_at = 0
+                images, synced_at = sync_catalog(repo_path, catalog_path, schedule), time.time()
+        except SystemExit:
+            stop.wait(SERVE_RETRY_INTERVAL)
+            continue
+
+        wake_at = min(filter(None, (
+            schedule.next_poll_at(), synced_at + sync_interval, pending_since and pending_since + batch_window,
+        )))
+        stop.wait(max(wake_at - time.time(), 0))
+
+    schedule.save()
+
+
+def positive_int(value: str) -> int:
+    if not value.isdigit() or int(value) < 1:
+        raise argparse.ArgumentTypeError(f'{value!r} is not a positive integer')
+    return int(value)
+
+
+def positive_float(value: str) -> float:
+    try:
+        if float(value) > 0:
+            return float(value)
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f'{value!r} is not a positive number')
+
+
+def registry_limit(value: str) -> tuple:
+    try:
+        return parse_registry_limit(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def registry_rewrite(value: str) -> tuple:
+    try:
+        return parse_registry_rewrite(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def registry_mirror(value: str) -> tuple:
+    try:
+        return parse_registry_mirror(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def non_negative_int(value: str) -> int:
+    if not value.isdigit():
+        raise argparse.ArgumentTypeError(f'{value!r} is not a non-negative integer')
+    return int(value)
+
+
+def add_push_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        '--push', '-p', action='store_true', help='Push changes to git repository with provided credentials',
+        default=False
+    )
+    parser.add_argument(
+        '--pr-backend', choices=PR_BACKENDS, default=PR_BACKEND,
+        help='Create pull requests natively with the GitHub REST API or with the gh CLI'
+    )
+
+
+def add_per_app_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        '--per-app-prs', action='store_true', default=False,
+        help='Commit every upgraded app to its own branch (and PR when pushing) prepared in a separate git worktree'
+    )
+
+
+def add_lookup_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        '--jobs', '-j', type=positive_int, default=1,
+        help='Number of catalog item(s) and image tag lookups to process concurrently'
+    )
+    parser.add_argument(
+        '--tags-cache', default=DEFAULT_TAG_CACHE_PATH,
+        help='Path of the file where retrieved image tags are cached across runs'
+    )
+    parser.add_argument(
+        '--no-tags-cache', action='store_true', default=False,
+        help='Do not persist retrieved image tags across runs'
+    )
+    parser.add_argument(
+        '--tags-cache-ttl', type=positive_int, default=DEFAULT_TAG_CACHE_TTL,
+        help='Number of seconds cached image tags are considered fresh'
+    )
+    parser.add_argument(
+        '--full-tags-refresh-interval', type=non_negative_int, default=DEFAULT_FULL_REFRESH_INTERVAL,
+        help='Number of seconds after which the complete list of image tags is retrieved again, until then only '
+        'tags which sort after the greatest known tag are retrieved which misses new tags sorting before it '
+        '(0, the default, always retrieves the complete list)'
+    )
+    parser.add_argument(
+        '--refresh-tags', action='store_true', default=False,
+        help='Ignore cached image tags and retrieve them again from the registries'
+    )
+    parser.add_argument(
+        '--validation-cache', default=DEFAULT_VALIDATION_CACHE_PATH,
+        help='Path of the file where content hashes of successfully validated item(s) are stored'
+    )
+    parser.add_argument(
+        '--validation-cache-size', type=positive_int, default=DEFAULT_VALIDATION_CACHE_MAX_ENTRIES,
+        help='Maximum number of validated item content hashes to keep'
+    )
+    parser.add_argument(
+        '--no-validation-cache', action='store_true', default=False,
+        help='Validate every item even if it has not changed since it was last validated successfully'
+    )
+    parser.add_argument(
+        '--strategy-cache', default=DEFAULT_STRATEGY_CACHE_PATH,
+        help='Path of the file where upgrade decisions of item(s) are stored with a fingerprint of their inputs'
+    )
+    parser.add_argument(
+        '--strategy-cache-size', type=positive_int, default=DEFAULT_STRATEGY_CACHE_MAX_ENTRIES,
+        help='Maximum number of item upgrade decisions to keep'
+    )
+    parser.add_argument(
+        '--no-strategy-cache', action='store_true', default=False,
+        help='Run the upgrade strategy of every item even if its inputs have not changed since it was last run'
+    )
+    parser.add_argument(
+        '--tags-backend', choices=TAGS_BACKENDS, default=TAGS_BACKEND,
+        help='Retrieve image tags natively from the registry HTTP API (falling back to skopeo) or with skopeo only'
+    )
+    parser.add_argument(
+        '--insecure-registry', action='append', default=[], dest='insecure_registries',
+        help='Registry which should be queried over plain HTTP, can be specified multiple times'
+    )
+    parser.add_argument(
+        '--registry-concurrency', type=positive_int, default=DEFAULT_REGISTRY_CONCURRENCY,
+        help='Maximum number of concurrent image tag lookups per registry'
+    )
+    parser.add_argument(
+        '--registry-rate', type=positive_float,
+        help='Maximum number of requests per second sent to a registry (unlimited by default)'
+    )
+    parser.add_argument(
+        '--registry-limit', action='append', default=[], type=registry_limit, dest='registry_limits',
+        help='Concurrency and optionally requests per second for a specific registry as REGISTRY=CONCURRENCY[:RATE], '
+        'can be specified multiple times (docker.io defaults to 4:5)'
+    )
+    parser.add_argument(
+        '--registry-retries', type=non_negative_int, default=DEFAULT_REGISTRY_RETRIES,
+        help='Number of times a throttled or failed registry request is retried with jittered backoff'
+    )
+    parser.add_argument(
+        '--registry-max-wait', type=non_negative_int, default=DEFAULT_REGISTRY_MAX_WAIT,
+        help='Maximum number of seconds to wait when a registry asks us to back off before failing its lookups'
+    )
+    parser.add_argument(
+        '--registry-rewrite', action='append', default=[], type=registry_rewrite, dest='registry_rewrites',
+        help='Look up tags of images whose name starts with SOURCE (registry[/path]) from TARGET instead as '
+        'SOURCE=TARGET, can be specified multiple times and the first matching rewrite is applied'
+    )
+    parser.add_argument(
+        '--registry-mirror', action='append', default=[], type=registry_mirror, dest='registry_mirrors',
+        help='Mirror to look up tags of a registry from as REGISTRY=MIRROR[/PATH], can be specified multiple times '
+        'and mirrors are tried in the order specified before the registry itself'
+    )
+    parser.add_argument(
+        '--registry-mirror-timeout', type=positive_float, default=DEFAULT_MIRROR_TIMEOUT,
+        help='Number of seconds after which a tag lookup from a mirror fails over to the next mirror or registry'
+    )
+    parser.add_argument(
+        '--catalog-index',
+        help='Path of the file where the catalog index is persisted so that unchanged item(s) are not read again '
+        '(defaults to a file in the user cache directory specific to the catalog path)'
+    )
+    parser.add_argument(
+        '--no-catalog-index', action='store_true', default=False,
+        help='Read every catalog item from disk instead of using a catalog index'
+    )
+
+
+def shard(value: str) -> tuple:
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def add_selection_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        '--train', action='append', default=[], dest='trains',
+        help='Only process item(s) of this train, can be specified multiple times'
+    )
+    parser.add_argument(
+        '--item', action='append', default=[], dest='items',
+        help='Only process item(s) whose name or train/name matches this glob pattern, can be specified multiple times'
+    )
+    parser.add_argument(
+        '--shard', type=shard,
+        help='Only process item(s) of shard INDEX/COUNT (0 <= INDEX < COUNT), item(s) are assigned to shards by a '
+        'stable hash of train/item'
+    )
+
+
+def add_snapshot_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        '--tags-from',
+        help='Path of a tags snapshot written by fetch-tags, image tags are then only retrieved from it and '
+        'registries are not queried at all'
+    )
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        '--profile', help='Record timing of every item and phase and write it to this file as a Chrome trace'
+    )
+    parser.add_argument(
+        '--profile-top', type=positive_int, default=10,
+        help='Number of slowest spans to print at the end of a profiled run'
+    )
+
+
+@contextlib.contextmanager
+def profile(args: argparse.Namespace):
+    if not args.profile:
+        yield
+        return
+
+    profiler = setup_profiler()
+    try:
+        yield
+    finally:
+        profiler.write(args.profile)
+        print(f'[\033[92mOK\x1B[0m]\tProfile written to {args.profile!r}')
+        print(profiler.report(args.profile_top))
+
+
+def get_catalog_paths(args: argparse.Namespace) -> list:
+    try:
+        if args.manifest:
+            catalogs = load_manifest(args.manifest)
+        else:
+            validate_catalogs(args.paths)
+            catalogs = [{'path': path} for path in args.paths]
+    except ValidationException as e:
+        print(f'[\033[91mFAILED\x1B[0m]\t{e}')
+        exit(1)
+
+    if args.catalog_index and len(catalogs) > 1:
+        print('[\033[91mFAILED\x1B[0m]\t--catalog-index can only be specified when updating a single catalog')
+        exit(1)
+
+    setup_repo_settings(catalogs)
+    return [catalog['path'] for catalog in catalogs]
+
+
+@contextlib.contextmanager
+def time_boxed(args: argparse.Namespace):
+    if not args.time_budget:
+        yield
+        return
+
+    budget = setup_time_budget(args.time_budget, args.time_budget_reserve, RunProgress(args.run_progress))
+    try:
+        yield
+    finally:
+        budget.progress.save()
+        if budget.deferred:
+            print(
+                f'[\033[91mFAILED\x1B[0m]\t{budget.deferred} item(s) were deferred to the next run as the time '
+                'budget was exhausted'
+            )
+
+
+@contextlib.contextmanager
+def pull_requests(args: argparse.Namespace):
+    setup_pr_backend(args.pr_backend)
+    try:
+        yield
+    finally:
+        close_github_client()
+
+
+@contextlib.contextmanager
+def setup_lookups(args: argparse.Namespace, catalog_paths: Optional[list] = None):
+    setup_tags_backend(args.tags_backend)
+    setup_registry_endpoints(args.registry_rewrites, args.registry_mirrors, args.registry_mirror_timeout)
+    registry_client = None
+    if getattr(args, 'tags_from', None):
+        try:
+            setup_tag_snapshot(args.tags_from)
+        except (OSError, ValueError) as e:
+            print(f'[\033[91mFAILED\x1B[0m]\tUnable to load tags snapshot: {e}')
+            exit(1)
+        print(f'[\033[92mOK\x1B[0m]\tImage tags are retrieved from {args.tags_from!r} snapshot')
+    elif args.tags_backend == 'registry':
+        # Registry client (and asyncio/aiohttp with it) is not imported at all when tags are retrieved with skopeo
+        from catalog_update.registry import setup_registry_client
+
+        registry_client = setup_registry_client(
+            insecure_registries=args.insecure_registries, scheduler=RegistryScheduler(
+                args.registry_concurrency, args.registry_rate, dict(args.registry_limits), args.registry_retries,
+                args.registry_max_wait,
+            ),
+        )
+    tag_cache = setup_tag_cache(
+        None if args.no_tags_cache else args.tags_cache, args.tags_cache_ttl, refresh=args.refresh_tags,
+        full_refresh_interval=args.full_tags_refresh_interval,
+    )
+    validation_cache = None if args.no_validation_cache else setup_validation_cache(
+        args.validation_cache, args.validation_cache_size
+    )
+    strategy_cache = None if args.no_strategy_cache else setup_strategy_cache(
+        args.strategy_cache, args.strategy_cache_size
+    )
+    catalog_indexes = [] if args.no_catalog_index else [
+        setup_catalog_index(catalog_path, args.catalog_index or default_catalog_index_path(catalog_path))
+        for catalog_path in catalog_paths or [args.path]
+    ]
+    try:
+        yield
+    finally:
+        tag_cache.save()
+        if validation_cache:
+            validation_cache.save()
+        if strategy_cache:
+            strategy_cache.save()
+        for catalog_index in catalog_indexes:
+            catalog_index.save()
+        if registry_client:
+            registry_client.close()
+
+
 def main() -> None:
     # TODO: Improve git commit/push workflow allowing more customization in next cycle
     parser = argparse.ArgumentParser(prog='catalog_update')
@@ -119,15 +894,136 @@ def main() -> None:
     update = subparsers.add_parser(
         'update', help='Update version of catalog item(s) if newer image versions are available'
     )
-    update.add_argument('--path', help='Specify path to a valid TrueNAS compliant catalog', required=True)
+    catalogs = update.add_mutually_exclusive_group(required=True)
+    catalogs.add_argument(
+        '--path', action='append', dest='paths',
+        help='Specify path to a valid TrueNAS compliant catalog, can be specified multiple times to update catalogs '
+        'of different repositories in a single run'
+    )
+    catalogs.add_argument(
+        '--manifest',
+        help='Path of a json manifest listing catalogs to update with their base branch and reviewers i.e '
+        '{"catalogs": [{"path": "repo/library/ix-dev", "base_branch": "master", "reviewers": ["user"]}]}'
+    )
+    add_push_argument(update)
+    add_per_app_argument(update)
+    add_selection_arguments(update)
+    add_lookup_arguments(update)
+    add_snapshot_argument(update)
     update.add_argument(
-        '--push', '-p', action='store_true', help='Push changes to git repository with provided credentials',
-        default=False
+        '--time-budget', type=positive_int,
+        help='Number of seconds the run may take, item(s) are started in order of their value and item(s) which '
+        'have not started once the budget is close to exhausted are deferred to the next run'
+    )
+    update.add_argument(
+        '--time-budget-reserve', type=non_negative_int, default=DEFAULT_TIME_BUDGET_RESERVE,
+        help='Number of seconds of the time budget kept for committing and pushing upgraded item(s)'
+    )
+    update.add_argument(
+        '--run-progress', default=DEFAULT_RUN_PROGRESS_PATH,
+        help='Path of the file where item(s) deferred by a time boxed run and when item(s) were last upgraded are '
+        'stored'
+    )
+    add_profile_arguments(update)
+
+    plan = subparsers.add_parser(
+        'plan', help='Decide upgrades of catalog item(s) and write them to a plan file without changing the catalog'
+    )
+    plan.add_argument('--path', help='Specify path to a valid TrueNAS compliant catalog', required=True)
+    plan.add_argument('--out', help='Path of the file where the plan should be written', required=True)
+    add_selection_arguments(plan)
+    add_lookup_arguments(plan)
+    add_snapshot_argument(plan)
+    add_profile_arguments(plan)
+
+    fetch_tags_parser = subparsers.add_parser(
+        'fetch-tags', help='Retrieve tags of every image used by catalog item(s) and write them to a snapshot file'
     )
+    fetch_tags_parser.add_argument('--path', help='Specify path to a valid TrueNAS compliant catalog', required=True)
+    fetch_tags_parser.add_argument('--out', help='Path of the file where the snapshot should be written', required=True)
+    add_selection_arguments(fetch_tags_parser)
+    add_lookup_arguments(fetch_tags_parser)
+    add_profile_arguments(fetch_tags_parser)
+
+    apply = subparsers.add_parser(
+        'apply', help='Upgrade catalog item(s) as decided in a plan file without querying registries'
+    )
+    apply.add_argument(
+        '--plan', action='append', required=True, dest='plans',
+        help='Path of the plan file generated by the plan command, can be specified multiple times to apply plans of '
+        'all shards in a single commit / PR'
+    )
+    apply.add_argument('--path', help='Specify path to the catalog if it differs from the one in the plan')
+    add_push_argument(apply)
+    add_per_app_argument(apply)
+    apply.add_argument(
+        '--jobs', '-j', type=positive_int, default=1, help='Number of app(s) to prepare concurrently with --per-app-prs'
+    )
+    add_profile_arguments(apply)
+
+    serve_parser = subparsers.add_parser(
+        'serve', help='Keep polling image tags on a per image schedule and upgrade item(s) whose images have new tags'
+    )
+    serve_parser.add_argument('--path', help='Specify path to a valid TrueNAS compliant catalog', required=True)
+    add_push_argument(serve_parser)
+    add_selection_arguments(serve_parser)
+    add_lookup_arguments(serve_parser)
+    serve_parser.add_argument(
+        '--poll-schedule', default=DEFAULT_POLL_SCHEDULE_PATH,
+        help='Path of the file where the polling schedule and observed releases of images are persisted'
+    )
+    serve_parser.add_argument(
+        '--min-poll-interval', type=positive_int, default=DEFAULT_MIN_POLL_INTERVAL,
+        help='Minimum number of seconds between tag lookups of an image'
+    )
+    serve_parser.add_argument(
+        '--max-poll-interval', type=positive_int, default=DEFAULT_MAX_POLL_INTERVAL,
+        help='Maximum number of seconds between tag lookups of an image'
+    )
+    serve_parser.add_argument(
+        '--batch-window', type=non_negative_int, default=600,
+        help='Number of seconds to wait for more item(s) to be affected before upgrading them in a single commit / PR'
+    )
+    serve_parser.add_argument(
+        '--sync-interval', type=positive_int, default=3600,
+        help='Number of seconds after which the catalog is updated from upstream to pick up changed item(s)'
+    )
+
+    merge = subparsers.add_parser('merge', help='Merge plans of shards into a single plan')
+    merge.add_argument(
+        '--plan', action='append', required=True, dest='plans',
+        help='Path of a plan file to merge, should be specified for every shard'
+    )
+    merge.add_argument('--out', help='Path of the file where the merged plan should be written', required=True)
 
     args = parser.parse_args()
+    if args.action in ('update', 'plan', 'fetch-tags', 'serve'):
+        setup_item_selection(args.trains, args.items, args.shard)
+
     if args.action == 'update':
-        update_trains(args.path, args.push)
+        catalog_paths = get_catalog_paths(args)
+        with time_boxed(args), profile(args), setup_lookups(args, catalog_paths), pull_requests(args):
+            update_catalogs(catalog_paths, args.push, args.jobs, args.per_app_prs)
+    elif args.action == 'plan':
+        with profile(args), setup_lookups(args):
+            plan_trains(args.path, args.out, args.jobs)
+    elif args.action == 'fetch-tags':
+        with profile(args), setup_lookups(args):
+            fetch_tags(args.path, args.out, args.jobs)
+    elif args.action == 'apply':
+        with profile(args), pull_requests(args):
+            apply_plan_file(args.path, args.plans, args.push, args.per_app_prs, args.jobs)
+    elif args.action == 'serve':
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+        with setup_lookups(args), pull_requests(args):
+            serve(
+                args.path, args.push, PollSchedule(args.poll_schedule, args.min_poll_interval, args.max_poll_interval),
+                stop, args.jobs, args.batch_window, args.sync_interval,
+            )
+    elif args.action == 'merge':
+        merge_plan_files(args.plans, args.out)
     else:
         parser.print_help()
 
@@ -0,0 +1,64 @@
+import fnmatch
+import hashlib
+
+from typing import Optional
+
+
+class ItemSelection:
+    # Item(s) to process in a run. Item(s) are assigned to shards by a hash of `train/item` which does not depend
+    # on the process, catalog path or the order of item(s), so every runner computes the same assignment.
+
+    def __init__(self, trains: Optional[list] = None, items: Optional[list] = None, shard: Optional[tuple] = None):
+        self.trains = sorted(set(trains or []))
+        self.items = list(items or [])
+        self.shard = shard
+
+    @property
+    def restricted(self) -> bool:
+        return bool(self.trains or self.items or self.shard)
+
+    def train_selected(self, train: str) -> bool:
+        return not self.trains or train in self.trains
+
+    def item_selected(self, train: str, item: str) -> bool:
+        if not self.train_selected(train):
+            return False
+
+        if self.items and not any(
+            fnmatch.fnmatchcase(item, pattern) or fnmatch.fnmatchcase(f'{train}/{item}', pattern)
+            for pattern in self.items
+        ):
+            return False
+
+        return not self.shard or item_shard(train, item, self.shard[1]) == self.shard[0]
+
+    def to_dict(self) -> dict:
+        return {
+            'trains': self.trains,
+            'items': self.items,
+            'shard': {'index': self.shard[0], 'count': self.shard[1]} if self.shard else None,
+        }
+
+
+def item_shard(train: str, item: str, count: int) -> int:
+    return int.from_bytes(hashlib.sha256(f'{train}/{item}'.encode()).digest()[:8], 'big') % count
+
+
+def parse_shard(value: str) -> tuple:
+    index, sep, count = value.partition('/')
+    if not sep or not index.isdigit() or not count.isdigit() or not 0 <= int(index) < int(count):
+        raise ValueError(f'{value!r} is not a valid shard, expected INDEX/COUNT with 0 <= INDEX < COUNT')
+    return int(index), int(count)
+
+
+ITEM_SELECTION = ItemSelection()
+
+
+def get_item_selection() -> ItemSelection:
+    return ITEM_SELECTION
+
+
+def setup_item_selection(*args, **kwargs) -> ItemSelection:
+    global ITEM_SELECTION
+    ITEM_SELECTION = ItemSelection(*args, **kwargs)
+    return ITEM_SELECTION
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import threading
+import time
+
+from typing import Optional
+
+from .utils import cache_path, read_json, write_json
+
+
+DEFAULT_STRATEGY_CACHE_PATH = cache_path('strategy_results.json')
+DEFAULT_STRATEGY_CACHE_MAX_ENTRIES = 5000
+# Bumped whenever the way upgrade summaries are decided changes, so that older decisions are not reused
+STRATEGY_CACHE_VERSION = 1
+
+
+def files_digest(item_path: str, file_names: list, extra: Optional[str] = None) -> str:
+    digest = hashlib.sha256(str(STRATEGY_CACHE_VERSION).encode())
+    if extra:
+        digest.update(extra.encode() + b'\0')
+    for file_name in file_names:
+        digest.update(file_name.encode() + b'\0')
+        try:
+            with open(os.path.join(item_path, file_name), 'rb') as f:
+                digest.update(f.read())
+        except FileNotFoundError:
+            digest.update(b'\1')
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def tags_digest(tags: list) -> str:
+    return hashlib.sha256('\n'.join(tags).encode()).hexdigest()
+
+
+class StrategyCache:
+    # Last upgrade decision of every item with the fingerprint of its inputs, so that item(s) whose values file,
+    # upgrade info, upgrade strategy and image tags have not changed do not run their upgrade strategy again
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = DEFAULT_STRATEGY_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = self.load()
+
+    def load(self) -> dict:
+        return read_json(self.path, {})
+
+    def get(self, item_path: str, files_hash: str) -> Optional[dict]:
+        with self.lock:
+            entry = self.entries.get(item_path)
+            if not isinstance(entry, dict) or entry.get('files') != files_hash:
+                return None
+            entry['used_at'] = time.time()
+            return entry
+
+    def images(self, item_path: str) -> Optional[list]:
+        # Image repositories the item used when its last decision was made, None if there is no decision
+        with self.lock:
+            entry = self.entries.get(item_path)
+            if not isinstance(entry, dict) or not isinstance(entry.get('images'), dict):
+                return None
+            return [r for r in entry['images'].values() if isinstance(r, str)]
+
+    def upgrade_pending(self, item_path: str) -> bool:
+        # Whether the last decision made for the item was to upgrade it, regardless of whether its inputs changed since
+        with self.lock:
+            entry = self.entries.get(item_path)
+            return isinstance(entry, dict) and isinstance(entry.get('summary'), dict) and not entry['summary'].get(
+                'error'
+            )
+
+    def add(self, item_path: str, files_hash: str, images: dict, tags: dict, summary: dict) -> None:
+        with self.lock:
+            self.entries[item_path] = {
+                'files': files_hash,
+                'images': images,
+                'tags': tags,
+                'summary': summary,
+                'used_at': time.time(),
+            }
+
+    def save(self) -> None:
+        if not self.path:
+            return
+
+        with self.lock:
+            entries = sorted(
+                self.entries.items(), key=lambda e: e[1].get('used_at', 0) if isinstance(e[1], dict) else 0,
+                reverse=True,
+            )[:self.max_entries]
+
+        write_json(self.path, dict(entries))
+
+
+STRATEGY_CACHE = None
+
+
+def get_strategy_cache() -> Optional[StrategyCache]:
+    return STRATEGY_CACHE
+
+
+def setup_strategy_cache(*args, **kwargs) -> StrategyCache:
+    global STRATEGY_CACHE
+    STRATEGY_CACHE = StrategyCache(*args, **kwargs)
+    return STRATEGY_CACHE
@@ -0,0 +1,141 @@
+import threading
+import time
+
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from .tag_filter import TagCollector, TagFilter
+from .utils import cache_path, read_json, write_json
+
+
+DEFAULT_TAG_CACHE_PATH = cache_path('image_tags.json')
+DEFAULT_TAG_CACHE_TTL = 60 * 60
+DEFAULT_TAG_CACHE_MAX_ENTRIES = 2000
+# Incremental lookups only see tags which sort after the greatest known tag, which releases like 1.10.0 after 1.9.0
+# or repositories with a `latest` tag do not, so they are opt-in and complete tag lists are retrieved by default
+DEFAULT_FULL_REFRESH_INTERVAL = 0
+
+
+class TagCache:
+
+    def __init__(
+        self, path: Optional[str] = None, ttl: int = DEFAULT_TAG_CACHE_TTL,
+        max_entries: int = DEFAULT_TAG_CACHE_MAX_ENTRIES, refresh: bool = False,
+        full_refresh_interval: int = DEFAULT_FULL_REFRESH_INTERVAL,
+    ):
+        self.path = path
+        self.ttl = ttl
+        # Entries which are no longer fresh are still retained until their last full retrieval is older than
+        # this interval, so that they can be used as a base to only retrieve tags added since then
+        self.full_refresh_interval = full_refresh_interval
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        # Futures of image tags retrieved (or being retrieved) in this run keyed by registry/image so that
+        # concurrent lookups of the same image are coalesced into a single request
+        self.futures = {}
+        self.entries = self.load()
+
+    def load(self) -> dict:
+        if self.refresh:
+            return {}
+        return {k: v for k, v in read_json(self.path, {}).items() if self.retained(v)}
+
+    def expired(self, entry: dict) -> bool:
+        return not isinstance(entry, dict) or time.time() - entry.get('fetched_at', 0) > self.ttl
+
+    def retained(self, entry: dict) -> bool:
+        return not self.expired(entry) or self.incremental_base(entry) is not None
+
+    def incremental_base(self, entry: Optional[dict]) -> Optional[list]:
+        if not isinstance(entry, dict) or time.time() - entry.get('full_fetched_at', 0) > self.full_refresh_interval:
+            return None
+        return entry['value'].get('Tags') or None
+
+    def get(
+        self, registry: str, image: str, retrieve: Callable[[str, str, Optional[list], Optional[TagFilter]], dict],
+        tag_filter: Optional[TagFilter] = None,
+    ) -> dict:
+        # Filtered lookups are kept under their own key as their tags are a subset of what the registry lists
+        key = f'{registry}/{image}' + (f'?{tag_filter.key}' if tag_filter else '')
+        with self.lock:
+            future = self.futures.get(key)
+            owner = future is None
+            if owner:
+                future = self.futures[key] = Future()
+                entry = self.entries.get(key)
+                if entry and not self.expired(entry):
+                    future.set_result(entry['value'])
+                    return entry['value']
+                # Complete tag list might have been retrieved already, then filtering it does not need a request
+                unfiltered = self.entries.get(f'{registry}/{image}') if tag_filter else None
+                if unfiltered and not self.expired(unfiltered):
+                    collector = TagCollector(tag_filter)
+                    collector.extend(unfiltered['value'].get('Tags') or [])
+                    value = {**unfiltered['value'], 'Tags': collector.result()}
+                    future.set_result(value)
+                    return value
+
+        if not owner:
+            return future.result()
+
+        known_tags = self.incremental_base(entry)
+        try:
+            value = retrieve(registry, image, known_tags, tag_filter)
+        except BaseException as e:
+            with self.lock:
+                # Failures are not cached so that a later lookup of the same image can try again
+                self.futures.pop(key, None)
+            future.set_exception(e)
+            raise
+        else:
+            with self.lock:
+                now = time.time()
+                self.entries[key] = {
+                    'value': value,
+                    'fetched_at': now,
+                    # An incremental retrieval does not account for deleted tags, so we keep track of when
+                    # we last retrieved the complete list to periodically do that again
+                    'full_fetched_at': entry['full_fetched_at'] if known_tags else now,
+                }
+            future.set_result(value)
+            return value
+
+    def invalidate(self, registry: str, image: str, complete: bool = False) -> None:
+        # Next lookup of the image retrieves its tags again (incrementally if possible unless `complete` is set), a
+        # lookup which is still in progress is left alone so that its callers get its result. Filtered lookups of
+        # the image are invalidated as well.
+        key = f'{registry}/{image}'
+        with self.lock:
+            for k in [k for k in self.futures if k == key or k.startswith(f'{key}?')]:
+                if self.futures[k].done():
+                    self.futures.pop(k)
+            for k in filter(lambda k: k == key or k.startswith(f'{key}?'), self.entries):
+                self.entries[k]['fetched_at'] = 0
+                if complete:
+                    self.entries[k]['full_fetched_at'] = 0
+
+    def save(self) -> None:
+        if not self.path:
+            return
+
+        with self.lock:
+            entries = sorted(
+                ((k, v) for k, v in self.entries.items() if self.retained(v)),
+                key=lambda e: e[1]['fetched_at'], reverse=True,
+            )[:self.max_entries]
+
+        write_json(self.path, dict(entries))
+
+
+TAG_CACHE = TagCache()
+
+
+def get_tag_cache() -> TagCache:
+    return TAG_CACHE
+
+
+def setup_tag_cache(*args, **kwargs) -> TagCache:
+    global TAG_CACHE
+    TAG_CACHE = TagCache(*args, **kwargs)
+    return TAG_CACHE
@@ -0,0 +1,120 @@
+import codecs
+import heapq
+import itertools
+import json
+import re
+
+from typing import Iterable, Optional
+
+
+SEMVER_RE = re.compile(r'^v?(\d+)\.(\d+)\.(\d+)$')
+TAG_RE = re.compile(r'\s*(?:"((?:[^"\\]|\\.)*)"\s*([,\]])|(\]))')
+# Number of characters kept while looking for the tags key, so that a key split across chunks is still found
+KEY_LOOKBEHIND = 64
+TAGS_CHUNK_SIZE = 64 * 1024
+
+
+class TagFilter:
+    # Per key filter declared in upgrade_info.json `tag_filters`. Tags are filtered while they are read from the
+    # registry (or skopeo / a snapshot), so only tags which can be of interest to the upgrade strategy are kept.
+
+    def __init__(
+        self, include: Optional[str] = None, exclude: Optional[str] = None, semver_only: bool = False,
+        max_recent: Optional[int] = None,
+    ):
+        if max_recent and not semver_only:
+            raise ValueError('Tags can only be limited to the most recent ones along with semver_only')
+        self.include = re.compile(include) if include else None
+        self.exclude = re.compile(exclude) if exclude else None
+        self.semver_only = semver_only
+        self.max_recent = max_recent
+        self.key = json.dumps(
+            {'include': include, 'exclude': exclude, 'semver_only': semver_only, 'max_recent': max_recent},
+            sort_keys=True,
+        )
+
+    @classmethod
+    def from_spec(cls, spec: Optional[dict]) -> Optional['TagFilter']:
+        return cls(**spec) if spec else None
+
+    def accepts(self, tag: str) -> bool:
+        if self.semver_only and not SEMVER_RE.match(tag):
+            return False
+        if self.include and not self.include.search(tag):
+            return False
+        return not (self.exclude and self.exclude.search(tag))
+
+
+class TagCollector:
+    # Collects tags accepted by the filter while keeping at most `max_recent` of them, which are the highest versions
+
+    def __init__(self, tag_filter: Optional[TagFilter] = None):
+        self.filter = tag_filter
+        self.counter = itertools.count()
+        self.heap = [] if tag_filter and tag_filter.max_recent else None
+        self.tags = [] if self.heap is None else None
+
+    def add(self, tag: str) -> None:
+        if self.filter and not self.filter.accepts(tag):
+            return
+
+        if self.heap is None:
+            self.tags.append(tag)
+            return
+
+        entry = (tuple(map(int, SEMVER_RE.match(tag).groups())), next(self.counter), tag)
+        if len(self.heap) < self.filter.max_recent:
+            heapq.heappush(self.heap, entry)
+        else:
+            heapq.heappushpop(self.heap, entry)
+
+    def extend(self, tags: Iterable[str]) -> None:
+        for tag in tags:
+            self.add(tag)
+
+    def result(self) -> list:
+        if self.heap is None:
+            return list(self.tags)
+        # Tags are returned in the order they were listed in
+        return [e[2] for e in sorted(self.heap, key=lambda e: e[1])]
+
+
+class TagStream:
+    # Incremental parser of a json document listing tags under `key` i.e registry `{"name": .., "tags": [..]}`
+    # or skopeo `{"Repository": .., "Tags": [..]}`. Tags are handed over as soon as they are read, so the complete
+    # document never needs to be kept in memory.
+
+    def __init__(self, key: str = 'tags'):
+        self.key_re = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.state = 'key'
+        self.first_tag = None
+
+    def feed(self, data: bytes, final: bool = False) -> list:
+        self.buffer += self.decoder.decode(data, final)
+        tags = []
+        if self.state == 'key':
+            match = self.key_re.search(self.buffer)
+            if not match:
+                self.buffer = self.buffer[-KEY_LOOKBEHIND:]
+                return tags
+            self.buffer = self.buffer[match.end():]
+            self.state = 'tags'
+
+        pos = 0
+        while self.state == 'tags':
+            match = TAG_RE.match(self.buffer, pos)
+            if not match:
+                break
+            pos = match.end()
+            if match.group(3) is None:
+                tag = match.group(1)
+                tags.append(json.loads(f'"{tag}"') if '\\' in tag else tag)
+            if match.group(3) or match.group(2) == ']':
+                self.state = 'done'
+
+        self.buffer = self.buffer[pos:] if self.state == 'tags' else ''
+        if self.first_tag is None and tags:
+            self.first_tag = tags[0]
+        return tags
@@ -0,0 +1,94 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+
+from typing import Optional
+
+from .exceptions import RegistryError
+from .tag_filter import TagCollector, TagFilter
+
+
+TAG_SNAPSHOT_VERSION = 1
+METADATA_MEMBER = 'snapshot.json'
+
+
+def tags_member(registry: str, image: str) -> str:
+    return f'tags/{registry}/{image}'
+
+
+def write_tag_snapshot(path: str, images_tags: dict, failed: Optional[dict] = None) -> None:
+    # Snapshot is a zip archive with a compressed member listing the tags of every image one per line, so an
+    # offline run only decompresses the tags of images it actually looks up and reads them line by line
+    dir_name = os.path.dirname(path) or '.'
+    os.makedirs(dir_name, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=dir_name, delete=False) as f:
+        with zipfile.ZipFile(f, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr(METADATA_MEMBER, json.dumps({
+                'version': TAG_SNAPSHOT_VERSION,
+                'created_at': time.time(),
+                'images': len(images_tags),
+                'failed': failed or {},
+            }))
+            for (registry, image), tags in sorted(images_tags.items()):
+                zf.writestr(tags_member(registry, image), '\n'.join(tags))
+    try:
+        os.chmod(f.name, 0o644)
+        os.replace(f.name, path)
+    except OSError:
+        os.unlink(f.name)
+        raise
+
+
+class TagSnapshot:
+    # Tags of images retrieved earlier by fetch-tags, used instead of the registry for runs without network access
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            self.zip = zipfile.ZipFile(path, 'r')
+            self.metadata = json.loads(self.zip.read(METADATA_MEMBER))
+        except (zipfile.BadZipFile, KeyError, ValueError):
+            raise ValueError(f'{path!r} is not a tags snapshot')
+        if self.metadata.get('version') != TAG_SNAPSHOT_VERSION:
+            raise ValueError(f'{path!r} snapshot version is not supported')
+        self.values = {}
+
+    def get(self, registry: str, image: str, tag_filter: Optional[TagFilter] = None) -> dict:
+        key = (registry, image, tag_filter.key if tag_filter else None)
+        with self.lock:
+            if key in self.values:
+                return self.values[key]
+
+        try:
+            member = self.zip.open(tags_member(registry, image))
+        except KeyError:
+            error = f'Image is not present in {self.path!r} snapshot'
+            failure = self.metadata['failed'].get(f'{registry}/{image}')
+            raise RegistryError(registry, image, f'{error} as its lookup failed: {failure}' if failure else error)
+
+        collector = TagCollector(tag_filter)
+        with io.TextIOWrapper(member, encoding='utf-8') as f:
+            collector.extend(filter(None, (line.rstrip('\n') for line in f)))
+
+        value = {'Repository': f'{registry}/{image}', 'Tags': collector.result()}
+        with self.lock:
+            self.values[key] = value
+        return value
+
+
+TAG_SNAPSHOT = None
+
+
+def get_tag_snapshot() -> Optional[TagSnapshot]:
+    return TAG_SNAPSHOT
+
+
+def setup_tag_snapshot(*args, **kwargs) -> TagSnapshot:
+    global TAG_SNAPSHOT
+    TAG_SNAPSHOT = TagSnapshot(*args, **kwargs)
+    return TAG_SNAPSHOT
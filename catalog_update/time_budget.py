@@ -0,0 +1,119 @@
+import threading
+import time
+
+from collections import Counter
+from typing import Callable, Optional
+
+from .strategy_cache import get_strategy_cache
+from .utils import cache_path, read_json, write_json
+
+
+DEFAULT_RUN_PROGRESS_PATH = cache_path('run_progress.json')
+# Seconds of the budget kept for committing / pushing whatever finished
+DEFAULT_TIME_BUDGET_RESERVE = 60
+TIME_BUDGET_EXHAUSTED = 'Deferred to the next run as the time budget was exhausted'
+# Value of an item is the number of days since it was last upgraded (up to MAX_STALENESS_DAYS), plus the number of
+# other item(s) sharing its images, plus PENDING_UPGRADE_VALUE if an upgrade of it was already found earlier
+MAX_STALENESS_DAYS = 30
+PENDING_UPGRADE_VALUE = 100
+
+
+class RunProgress:
+    # When item(s) were last processed / upgraded and which of them were deferred as the time budget was exhausted,
+    # so that the next time boxed run resumes with them
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = self.load()
+
+    def load(self) -> dict:
+        return read_json(self.path, {})
+
+    def get(self, item_path: str) -> dict:
+        with self.lock:
+            entry = self.entries.get(item_path)
+            return entry if isinstance(entry, dict) else {}
+
+    def record(self, item_path: str, summary: dict) -> None:
+        with self.lock:
+            entry = self.entries.setdefault(item_path, {})
+            entry['deferred'] = summary['error'] == TIME_BUDGET_EXHAUSTED
+            if not entry['deferred']:
+                entry['processed_at'] = time.time()
+            if summary['upgraded']:
+                entry['upgraded_at'] = time.time()
+
+    def save(self) -> None:
+        if not self.path:
+            return
+
+        with self.lock:
+            write_json(self.path, self.entries)
+
+
+class TimeBudget:
+    # Item(s) are started in order of their value and once less than `reserve` seconds of the budget are left, item(s)
+    # which have not started yet are deferred instead of being processed
+
+    def __init__(
+        self, seconds: int, reserve: int = DEFAULT_TIME_BUDGET_RESERVE, progress: Optional[RunProgress] = None
+    ):
+        self.deadline = time.monotonic() + seconds
+        self.reserve = reserve
+        self.progress = progress or RunProgress()
+        self.lock = threading.Lock()
+        self.deferred = 0
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def exhausted(self) -> bool:
+        return self.remaining() <= self.reserve
+
+    def budgeted(self, item_func: Callable) -> Callable:
+        def run(item_path: str, *args, **kwargs) -> dict:
+            if self.exhausted():
+                summary = {'upgraded': False, 'error': TIME_BUDGET_EXHAUSTED}
+                with self.lock:
+                    self.deferred += 1
+            else:
+                summary = item_func(item_path, *args, **kwargs)
+            self.progress.record(item_path, summary)
+            return summary
+
+        return run
+
+    def value(self, item_path: str, shared_images: int, now: float) -> float:
+        upgraded_at = self.progress.get(item_path).get('upgraded_at')
+        value = min((now - upgraded_at) / 86400, MAX_STALENESS_DAYS) if upgraded_at else MAX_STALENESS_DAYS
+        strategy_cache = get_strategy_cache()
+        if strategy_cache and strategy_cache.upgrade_pending(item_path):
+            value += PENDING_UPGRADE_VALUE
+        return value + shared_images
+
+    def order(self, item_paths: list, images: Optional[dict] = None) -> list:
+        # Item(s) deferred by the previous run are resumed first, then the most valuable item(s) are started first.
+        # `images` are the item(s) using every image which were already gathered for the catalog.
+        shared_images = Counter()
+        for items in (images or {}).values():
+            for item_path in items:
+                shared_images[item_path] += len(items) - 1
+
+        now = time.time()
+        return sorted(item_paths, key=lambda p: (
+            not self.progress.get(p).get('deferred'), -self.value(p, shared_images[p], now), p,
+        ))
+
+
+TIME_BUDGET = None
+
+
+def get_time_budget() -> Optional[TimeBudget]:
+    return TIME_BUDGET
+
+
+def setup_time_budget(*args, **kwargs) -> TimeBudget:
+    global TIME_BUDGET
+    TIME_BUDGET = TimeBudget(*args, **kwargs)
+    return TIME_BUDGET
@@ -1,36 +1,200 @@
+import functools
+import itertools
 import os
 
 from collections import defaultdict
+from concurrent.futures import Executor
+from typing import Callable, Iterable, Iterator, Optional
 
+from .catalog_index import find_item_record, get_catalog_index
 from .catalog_item import Item
+from .docker_utils import resolve_image
 from .exceptions import ValidationErrors, TrainNotFound
+from .profiling import span
+from .selection import get_item_selection
+from .strategy_cache import get_strategy_cache
+from .utils import get
+from .validation_cache import get_validation_cache, item_content_hash
 
 
-def update_items_in_train(train_path: str) -> dict:
+def update_item(item_path: str, tags_executor: Optional[Executor] = None) -> dict:
+    # Every item is isolated from the others, so if something unexpected goes wrong while upgrading
+    # one item we only skip that item instead of failing the whole run
+    item = Item(item_path, tags_executor, find_item_record(item_path))
+    with span('item', 'item', item=item_label(item_path)) as details:
+        summary = item_upgrade_summary(item)
+        if not summary['error']:
+            summary = apply_item_upgrade(item, summary)
+        details['error'] = summary['error']
+
+    return summary
+
+
+def plan_item(item_path: str, tags_executor: Optional[Executor] = None) -> dict:
+    with span('item', 'item', item=item_label(item_path)) as details:
+        summary = item_upgrade_summary(Item(item_path, tags_executor, find_item_record(item_path)))
+        details['error'] = summary['error']
+
+    return summary
+
+
+def item_label(item_path: str) -> str:
+    return '/'.join(os.path.normpath(item_path).split(os.sep)[-2:])
+
+
+def item_upgrade_summary(item: Item) -> dict:
+    try:
+        validate_item(item)
+    except ValidationErrors:
+        return {'upgraded': False, 'error': 'Validation failed'}
+    except Exception as e:
+        return {'upgraded': False, 'error': f'Failed to validate: {e}'}
+
+    try:
+        summary = item.upgrade_summary()
+        if not summary['error']:
+            summary['new_version'] = item.bump_version
+    except Exception as e:
+        return {'upgraded': False, 'error': f'Failed to upgrade: {e}'}
+
+    return summary
+
+
+def apply_item_upgrade(item: Item, summary: dict) -> dict:
+    try:
+        return item.apply_upgrade(summary, summary['new_version'])
+    except Exception as e:
+        return {'upgraded': False, 'error': f'Failed to upgrade: {e}'}
+
+
+def validate_item(item: Item) -> None:
+    validation_cache = get_validation_cache()
+    if not validation_cache:
+        with span('validate', 'phase', item=item_label(item.path)):
+            return item.validate()
+
+    # Item(s) which have not changed since they were last validated successfully are not validated again
+    with span('content_hash', 'phase', item=item_label(item.path)):
+        content_hash = item_content_hash(item.path)
+    if not content_hash or not validation_cache.validated(content_hash):
+        with span('validate', 'phase', item=item_label(item.path)):
+            item.validate()
+        if content_hash:
+            validation_cache.add(content_hash)
+
+
+def get_train_items(train_path: str) -> list:
+    catalog_path, train = os.path.split(os.path.normpath(train_path))
+    index = get_catalog_index(catalog_path)
+    if index:
+        items = index.item_names(train)
+    else:
+        items = sorted(filter(lambda i: os.path.isdir(os.path.join(train_path, i)), os.listdir(train_path)))
+
+    selection = get_item_selection()
+    return [os.path.join(train_path, item) for item in items if selection.item_selected(train, item)]
+
+
+def schedule_items_in_train(
+    train_path: str, executor: Optional[Executor] = None, tags_executor: Optional[Executor] = None,
+    item_func: Callable = update_item,
+) -> Iterator[tuple]:
     if not os.path.exists(train_path):
         raise TrainNotFound(train_path)
 
+    # When an executor is specified, item(s) are submitted right away and results are yielded in
+    # the order of item path(s) so that the summary stays deterministic regardless of completion order
+    item_paths = get_train_items(train_path)
+    func = functools.partial(item_func, tags_executor=tags_executor)
+    return zip(item_paths, executor.map(func, item_paths) if executor else map(func, item_paths))
+
+
+def schedule_items_in_order(
+    train_paths: list, executor: Executor, tags_executor: Optional[Executor] = None, item_func: Callable = update_item,
+    order: Optional[Callable[[list], list]] = None,
+) -> list:
+    # Item(s) of all trains are submitted in the given order, which decides the order they are started in, while
+    # results are still yielded per train in the order of item path(s)
+    missing = next((p for p in train_paths if not os.path.exists(p)), None)
+    if missing:
+        raise TrainNotFound(missing)
+
+    train_items = {train_path: get_train_items(train_path) for train_path in train_paths}
+    item_paths = list(itertools.chain.from_iterable(train_items.values()))
+    func = functools.partial(item_func, tags_executor=tags_executor)
+    futures = {item_path: executor.submit(func, item_path) for item_path in (
+        order(item_paths) if order else item_paths
+    )}
+    return [
+        (train_path, ((item_path, futures[item_path].result()) for item_path in paths))
+        for train_path, paths in train_items.items()
+    ]
+
+
+def summarize_items(results: Iterable[tuple]) -> dict:
     summary = {
         'skipped': {},
-        'upgraded': defaultdict(lambda: {'new_version': None, 'old_version': None, 'item_path': None}),
+        'upgraded': defaultdict(lambda: {
+            'new_version': None, 'old_version': None, 'item_path': None, 'changed_files': [],
+        }),
     }
-    for item_path in filter(os.path.isdir, map(lambda i: os.path.join(train_path, i), os.listdir(train_path))):
-        item = Item(item_path)
-        try:
-            item.validate()
-        except ValidationErrors:
-            summary['skipped'][item.name] = 'Validation failed'
-            continue
-
-        info = item.upgrade()
+    for item_path, info in results:
+        item_name = os.path.basename(item_path)
         if not info['upgraded']:
-            summary['skipped'][item.name] = info['error']
+            summary['skipped'][item_name] = info['error']
             continue
 
-        summary['upgraded'][item.name].update({
+        summary['upgraded'][item_name].update({
             'new_version': info['new_version'],
             'old_version': info['latest_version'],
             'item_path': item_path,
+            'changed_files': info['changed_files'],
         })
 
     return summary
+
+
+def image_items(train_paths: Iterable[str], cached: bool = False) -> dict:
+    # Item(s) using each (registry, image) with registry rewrites applied. Item(s) do a round-trip load of their
+    # values file later, here a safe load is enough as we only need to find image repositories. When `cached` is set,
+    # images recorded with the last upgrade decision of an item are used instead and only item(s) without one are
+    # parsed, which is good enough for hints like lookup priorities but might not reflect changed values files.
+    strategy_cache = get_strategy_cache() if cached else None
+    yaml = None
+    images = defaultdict(list)
+    for item_path in itertools.chain.from_iterable(map(get_train_items, train_paths)):
+        repositories = strategy_cache.images(item_path) if strategy_cache else None
+        if repositories is None:
+            if yaml is None:
+                import ruamel.yaml
+
+                yaml = ruamel.yaml.YAML(typ='safe')
+            repositories = item_repositories(item_path, yaml)
+
+        for repository in repositories:
+            image = resolve_image(repository)
+            if item_path not in images[image]:
+                images[image].append(item_path)
+
+    return images
+
+
+def item_repositories(item_path: str, yaml) -> list:
+    try:
+        upgrade_info = Item(item_path, record=find_item_record(item_path)).upgrade_info()
+        with open(os.path.join(item_path, upgrade_info['filename']), 'r') as f:
+            values = yaml.load(f)
+        image_values = [get(values, key) for key in upgrade_info['keys']]
+    except Exception:
+        # Item(s) report issues with their upgrade info / values file when they are processed
+        return []
+
+    return [
+        v['repository'] for v in image_values if isinstance(v, dict) and isinstance(v.get('repository'), str)
+    ]
+
+
+def update_items_in_train(
+    train_path: str, executor: Optional[Executor] = None, tags_executor: Optional[Executor] = None
+) -> dict:
+    return summarize_items(schedule_items_in_train(train_path, executor, tags_executor))
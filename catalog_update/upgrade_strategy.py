@@ -1,16 +1,48 @@
+import collections
+import functools
+import hashlib
+import json
+import re
+import threading
+
 from datetime import datetime
-from pkg_resources import parse_version
-from pkg_resources.extern.packaging.version import Version
+from packaging.version import InvalidVersion, Version
 from typing import Optional
 
 
+STRATEGY_TYPES = ('semver', 'datetime')
+# Caches are bounded as the serve daemon keeps ranking tags of every image it tracks for as long as it runs
+PARSE_CACHE_SIZE = 2 ** 16
+LATEST_TAG_CACHE_SIZE = 1024
+LATEST_TAG_CACHE = collections.OrderedDict()
+LATEST_TAG_CACHE_LOCK = threading.Lock()
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_semver(tag: str, allow_prerelease: bool = False) -> Optional[Version]:
+    try:
+        version = Version(tag)
+    except InvalidVersion:
+        return None
+    if version.is_prerelease and not allow_prerelease:
+        return None
+    return version
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_datetime(tag: str, date_format: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(tag, date_format)
+    except ValueError:
+        return None
+
+
 def semantic_versioning(tags: list) -> Optional[str]:
-    versions = [v for v in map(parse_version, tags) if isinstance(v, Version) and not v.is_prerelease]
+    versions = [v for v in map(parse_semver, tags) if v is not None]
     if not versions:
         return
 
-    versions.sort()
-    return str(versions[-1])
+    return str(max(versions))
 
 
 def datetime_versioning(tags: list, date_format: str) -> Optional[str]:
@@ -18,5 +50,71 @@ def datetime_versioning(tags: list, date_format: str) -> Optional[str]:
     if not versions:
         return
 
-    versions.sort()
-    return versions[-1].strftime(date_format)
+    return max(versions).strftime(date_format)
+
+
+def tag_parser(strategy: dict):
+    include = re.compile(strategy['include']) if strategy.get('include') else None
+    exclude = re.compile(strategy['exclude']) if strategy.get('exclude') else None
+    prefix = strategy.get('prefix') or ''
+    suffix = strategy.get('suffix') or ''
+    if strategy['type'] == 'semver':
+        allow_prerelease = strategy.get('allow_prerelease', False)
+        parse = functools.partial(parse_semver, allow_prerelease=allow_prerelease)
+    else:
+        parse = functools.partial(parse_datetime, date_format=strategy['format'])
+
+    def parser(tag: str):
+        # Tags are pinned to the specified prefix/suffix which are stripped before the tag is parsed i.e
+        # `v1.2.3-alpine` with `v` prefix and `-alpine` suffix is ranked as `1.2.3`
+        if not tag.startswith(prefix) or not tag.endswith(suffix) or len(tag) <= len(prefix) + len(suffix):
+            return None
+        if (include and not include.search(tag)) or (exclude and exclude.search(tag)):
+            return None
+        return parse(tag[len(prefix):len(tag) - len(suffix)])
+
+    return parser
+
+
+def rank_latest_tag(tags: list, strategy: dict) -> Optional[str]:
+    parser = tag_parser(strategy)
+    latest = latest_key = None
+    # A linear scan is enough to find the latest tag, sorting the whole list is not required
+    for tag in tags:
+        key = parser(tag)
+        if key is not None and (latest_key is None or key > latest_key):
+            latest, latest_key = tag, key
+
+    return latest
+
+
+def latest_tag(tags: list, strategy: dict, repository: Optional[str] = None) -> Optional[str]:
+    # Results are memoized so item(s) sharing a repository and strategy do not rank the same tags again. They are
+    # keyed on a digest of the tags instead of the tags themselves, which might be tens of thousands per repository.
+    key = (repository, hashlib.sha256('\n'.join(tags).encode()).hexdigest(), json.dumps(strategy, sort_keys=True))
+    with LATEST_TAG_CACHE_LOCK:
+        if key in LATEST_TAG_CACHE:
+            LATEST_TAG_CACHE.move_to_end(key)
+            return LATEST_TAG_CACHE[key]
+
+    latest = rank_latest_tag(tags, strategy)
+    with LATEST_TAG_CACHE_LOCK:
+        LATEST_TAG_CACHE[key] = latest
+        while len(LATEST_TAG_CACHE) > LATEST_TAG_CACHE_SIZE:
+            LATEST_TAG_CACHE.popitem(last=False)
+    return latest
+
+
+def evaluate_strategies(
+    strategies: dict, available_tags: dict, app_version_key: Optional[str] = None, repositories: Optional[dict] = None,
+) -> dict:
+    output = {'tags': {}, 'app_version': None}
+    for key, strategy in strategies.items():
+        tag = latest_tag(available_tags.get(key) or [], strategy, (repositories or {}).get(key))
+        if tag is not None:
+            output['tags'][key] = tag
+
+    if app_version_key:
+        output['app_version'] = output['tags'].get(app_version_key)
+
+    return output
@@ -1,5 +1,9 @@
+import json
 import os
 import subprocess
+import tempfile
+
+from typing import Optional
 
 from .exceptions import CalledProcessError
 
@@ -12,12 +16,13 @@ def run(*args, **kwargs) -> subprocess.CompletedProcess:
     check = kwargs.pop('check', True)
     shell = kwargs.pop('shell', False)
     env = kwargs.pop('env', None) or os.environ
+    input_data = kwargs.pop('input', None)
 
     proc = subprocess.Popen(
         args, stdout=kwargs['stdout'], stderr=kwargs['stderr'], shell=shell,
-        encoding='utf8', errors='ignore', env=env
+        encoding='utf8', errors='ignore', env=env, stdin=subprocess.PIPE if input_data is not None else None,
     )
-    stdout, stderr = proc.communicate()
+    stdout, stderr = proc.communicate(input_data)
 
     cp = subprocess.CompletedProcess(args, proc.returncode, stdout=stdout, stderr=stderr)
     if check and cp.returncode:
@@ -25,6 +30,44 @@ def run(*args, **kwargs) -> subprocess.CompletedProcess:
     return cp
 
 
+def write_file(path: str, contents: str) -> None:
+    # Written to a temporary file which then replaces the destination so that readers never see a partial file
+    dir_name = os.path.dirname(path) or '.'
+    os.makedirs(dir_name, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=dir_name, delete=False) as f:
+        f.write(contents)
+    try:
+        # Temporary files are only accessible by the owner, so we retain permissions of the file we replace
+        os.chmod(f.name, os.stat(path).st_mode & 0o7777 if os.path.exists(path) else 0o644)
+        os.replace(f.name, path)
+    except OSError:
+        os.unlink(f.name)
+        raise
+
+
+def write_json(path: str, data) -> None:
+    write_file(path, json.dumps(data))
+
+
+def read_json(path: Optional[str], default):
+    # Caches / state files which are missing, unreadable or corrupt should never fail a run, they are just rebuilt.
+    # `default` is returned unless the file holds json of the same type.
+    if not path or not os.path.isfile(path):
+        return default
+
+    try:
+        with open(path, 'r') as f:
+            data = json.loads(f.read())
+    except (OSError, json.JSONDecodeError):
+        return default
+
+    return data if isinstance(data, type(default)) else default
+
+
+def cache_path(name: str) -> str:
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'catalog_update', name)
+
+
 def partition(s):
     rv = ''
     while True:
@@ -0,0 +1,95 @@
+import hashlib
+import os
+import stat
+import threading
+import time
+
+from typing import Optional
+
+from .utils import cache_path, read_json, write_json
+
+
+DEFAULT_VALIDATION_CACHE_PATH = cache_path('validated_items.json')
+DEFAULT_VALIDATION_CACHE_MAX_ENTRIES = 5000
+
+
+def item_content_hash(item_path: str) -> Optional[str]:
+    # Hash covers relative path and contents of every file in the item directory i.e version directories,
+    # item.yaml, upgrade_info.json etc and the version of catalog_validation as a newer version of it might
+    # not consider the same content valid anymore. None is returned if the item could not be read, so that it is
+    # validated as if it was not in the cache.
+    import importlib.metadata
+
+    digest = hashlib.sha256()
+    try:
+        digest.update(importlib.metadata.version('catalog_validation').encode())
+    except importlib.metadata.PackageNotFoundError:
+        pass
+
+    try:
+        for root, dirs, files in os.walk(item_path):
+            dirs.sort()
+            # Symlinked directories are not walked, so they are hashed as links along with files
+            for file_name in sorted(files + [d for d in dirs if os.path.islink(os.path.join(root, d))]):
+                file_path = os.path.join(root, file_name)
+                digest.update(os.path.relpath(file_path, item_path).encode() + b'\0')
+                mode = os.lstat(file_path).st_mode
+                if stat.S_ISLNK(mode):
+                    # Links might be dangling or point to special files, so their target is hashed instead
+                    digest.update(b'->' + os.readlink(file_path).encode())
+                elif stat.S_ISREG(mode):
+                    with open(file_path, 'rb') as f:
+                        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                            digest.update(chunk)
+                digest.update(b'\0')
+    except OSError:
+        return None
+
+    return digest.hexdigest()
+
+
+class ValidationCache:
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = DEFAULT_VALIDATION_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        # Content hashes of item(s) which passed validation mapped to when they were last validated/seen
+        self.entries = self.load()
+
+    def load(self) -> dict:
+        return read_json(self.path, {})
+
+    def validated(self, content_hash: str) -> bool:
+        with self.lock:
+            if content_hash in self.entries:
+                self.entries[content_hash] = time.time()
+                return True
+        return False
+
+    def add(self, content_hash: str) -> None:
+        with self.lock:
+            self.entries[content_hash] = time.time()
+
+    def save(self) -> None:
+        if not self.path:
+            return
+
+        with self.lock:
+            # Least recently seen hashes are evicted first, these usually belong to older revisions of item(s)
+            entries = sorted(self.entries.items(), key=lambda e: e[1], reverse=True)[:self.max_entries]
+
+        write_json(self.path, dict(entries))
+
+
+VALIDATION_CACHE = None
+
+
+def get_validation_cache() -> Optional[ValidationCache]:
+    return VALIDATION_CACHE
+
+
+def setup_validation_cache(*args, **kwargs) -> ValidationCache:
+    global VALIDATION_CACHE
+    VALIDATION_CACHE = ValidationCache(*args, **kwargs)
+    return VALIDATION_CACHE
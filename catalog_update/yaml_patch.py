@@ -0,0 +1,137 @@
+import re
+
+from typing import Optional
+
+
+# Scalars which are written back plain, anything else is single quoted as ruamel would do when dumping
+PLAIN_SCALAR_RE = re.compile(r'^[A-Za-z0-9_][\w.+-]*$')
+NON_STR_SCALAR_RE = re.compile(
+    r'^(?:[-+]?(?:\d[\d_]*)?(?:\.[\d_]*)?(?:[eE][-+]?\d+)?|0[xob][\da-fA-F_]+|[-+]?\.(?:inf|Inf|INF)|'
+    r'\.(?:nan|NaN|NAN)|~|null|Null|NULL|true|True|TRUE|false|False|FALSE|yes|Yes|YES|no|No|NO|on|On|ON|off|Off|OFF|'
+    r'y|Y|n|N|[-+]?\d[\d_]*(?::[0-5]?\d)+(?:\.\d*)?|\d{4}-\d\d?-\d\d?(?:[Tt ].*)?)$'
+)
+# Characters a value scalar can not start with if we are to patch it, i.e anchors, tags, aliases and block scalars
+UNSUPPORTED_START = frozenset('&!*|>{}[]?%@`#\n')
+# Line breaks other than \n and byte order marks shift the line/column marks ruamel records
+UNSUPPORTED_CHARS_RE = re.compile('[\r\x85\u2028\u2029\ufeff]')
+
+
+def line_offsets(contents: str) -> list:
+    return [0] + [m.end() for m in re.finditer('\n', contents)]
+
+
+def quoted_end(contents: str, start: int, line_end: int) -> Optional[int]:
+    quote = contents[start]
+    index = start + 1
+    while index < line_end:
+        char = contents[index]
+        if char == '\\' and quote == '"':
+            # Escape sequences are not decoded here, so we can not tell whether the scalar is what we loaded
+            return None
+        if char == quote:
+            if quote == "'" and contents[index + 1:index + 2] == "'":
+                index += 2
+                continue
+            return index + 1
+        index += 1
+    # Quoted scalar spans multiple lines
+    return None
+
+
+def decode_scalar(text: str, style: str) -> str:
+    if style == "'":
+        return text[1:-1].replace("''", "'")
+    if style == '"':
+        return text[1:-1]
+    return text
+
+
+def encode_scalar(value: str, style: str) -> Optional[str]:
+    if not value.isprintable():
+        return None
+    if style == '"':
+        return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    if style == '' and PLAIN_SCALAR_RE.match(value) and not NON_STR_SCALAR_RE.match(value):
+        return value
+    return "'" + value.replace("'", "''") + "'"
+
+
+def scalar_span(contents: str, offsets: list, mapping, key: str) -> Optional[tuple]:
+    # Value of `key` is located using the line/column marks ruamel records while loading the mapping. Only single line
+    # plain or quoted scalars of block mappings whose text matches the loaded value are resolved, None is returned
+    # for everything else so that callers can fall back to dumping the whole document. (start, end, quote style) of
+    # the scalar text is returned otherwise.
+    lc = getattr(mapping, 'lc', None)
+    if lc is None or key not in mapping or mapping.fa.flow_style():
+        return None
+
+    value = mapping[key]
+    if value is None or isinstance(value, (bool, dict, list)):
+        return None
+
+    try:
+        key_line, key_column, line, column = lc.data[key]
+    except (KeyError, TypeError, ValueError):
+        return None
+    if line != key_line or line >= len(offsets):
+        return None
+
+    start = offsets[line] + column
+    line_end = offsets[line + 1] - 1 if line + 1 < len(offsets) else len(contents)
+    if start >= line_end or contents[start] in UNSUPPORTED_START:
+        return None
+
+    if contents[start] in ('"', "'"):
+        style = contents[start]
+        end = quoted_end(contents, start, line_end)
+        rest = contents[end:line_end].strip() if end else None
+        if end is None or rest and not rest.startswith('#'):
+            return None
+    else:
+        style = ''
+        comment = contents.find(' #', start, line_end)
+        end = start + len(contents[start:comment if comment != -1 else line_end].rstrip())
+        # Plain scalars continue on following lines which are indented deeper than their key
+        next_line = line + 1
+        while next_line < len(offsets):
+            text = contents[offsets[next_line]:offsets[next_line + 1] if next_line + 1 < len(offsets) else None]
+            if text.strip() and not text.strip().startswith('#'):
+                if len(text) - len(text.lstrip(' ')) > key_column:
+                    return None
+                break
+            next_line += 1
+
+    if decode_scalar(contents[start:end], style) != str(value):
+        return None
+    return start, end, style
+
+
+def patch_scalars(contents: str, changes: list) -> Optional[str]:
+    # Rewrites only the text of scalar values in `changes` which is a list of (mapping, key, new value) of mappings
+    # loaded from `contents`, leaving every other line as it is. None is returned if the position of any of them
+    # could not be resolved unambiguously.
+    if UNSUPPORTED_CHARS_RE.search(contents):
+        return None
+
+    offsets = line_offsets(contents)
+    patches = {}
+    for mapping, key, value in changes:
+        span = scalar_span(contents, offsets, mapping, key)
+        if span is None:
+            return None
+
+        start, end, style = span
+        text = encode_scalar(str(value), style)
+        if text is None or patches.setdefault(start, (end, text)) != (end, text):
+            return None
+
+    patched = []
+    position = 0
+    for start in sorted(patches):
+        end, text = patches[start]
+        if start < position:
+            return None
+        patched.extend((contents[position:start], text))
+        position = end
+    patched.append(contents[position:])
+    return ''.join(patched)